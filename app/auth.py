@@ -1,10 +1,19 @@
 import os
-from typing import Dict, Optional
+import jwt
+import json
+import time
+import hmac
+import base64
+import asyncio
+import hashlib
+from typing import Dict, Optional, Tuple
+from cryptography.fernet import Fernet, InvalidToken
 import httpx
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2AuthorizationCodeBearer
 
 from app.database import SessionDep
+from app.cache import cache
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,6 +23,12 @@ GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 GITHUB_REDIRECT_URI = os.getenv("GITHUB_REDIRECT_URI")
 GITHUB_ORG = os.getenv("GITHUB_ORG")
 GITHUB_TEAM_SLUG = os.getenv("GITHUB_TEAM_SLUG")
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+JWT_SECRET = os.getenv("JWT_SECRET")
+JWT_ALGORITHM = "HS256"
+JWT_ACCESS_TTL = int(os.getenv("JWT_ACCESS_TTL", "900"))
+JWT_REFRESH_TTL = int(os.getenv("JWT_REFRESH_TTL", str(7 * 24 * 3600)))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 GITHUB_SCOPES = {
         "read:org": "Read org membership",
         "read:user": "Read user name"
@@ -31,6 +46,7 @@ oauth2_scheme = OAuth2AuthorizationCodeBearer(
 )
 
 client = httpx.AsyncClient()
+pending: Dict[str, asyncio.Future] = {}
 
 async def get_access_token(code: str) -> str:
     """
@@ -94,54 +110,181 @@ async def get_github_user(token: str) -> Dict:
             detail="Could not fetch user data from GitHub."
         )
 
-async def check_dataset_permissions(datasets_id: int, session: SessionDep, token: str = Depends(oauth2_scheme)) -> dict:
+async def get_team_role(token: str, username: str) -> str:
     """
-    Checks users permission for endpoints.
+    Fetches the user's role in the Datalakes GitHub team.
     """
-    user_data = await get_github_user(token)
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
+    team_url = GITHUB_TEAM_MEMBERSHIP_URL.format(username=username)
+    team_response = await client.get(team_url, headers=headers)
+    return team_response.json().get('role', 'member')
+
+async def lookup_user(token: str, key: str) -> Tuple[Dict, Optional[str]]:
+    """
+    Fetches the user and team role from GitHub and caches them under key.
+
+    A failed role lookup is not cached, so a transient GitHub error only fails this request.
+    """
+    user_data = await get_github_user(token)
     try:
-        team_url = GITHUB_TEAM_MEMBERSHIP_URL.format(username=user_data["login"])
-        team_response = await client.get(team_url, headers=headers)
-        team_role = team_response.json().get('role', 'member')
-        if team_role == "maintainer":
-            return user_data
-        elif team_role == "member":
-            # Request username for dataset to verify ownership
-            print(datasets_id)
-            return user_data
+        team_role = await get_team_role(token, user_data["login"])
     except:
-        pass
+        team_role = None
+    if team_role is not None:
+        await cache.set(key, json.dumps({"user": user_data, "role": team_role}).encode(), ttl=AUTH_CACHE_TTL)
+    return user_data, team_role
+
+def user_key(token: str) -> str:
+    """
+    Cache key of the user and team role of a GitHub token.
+    """
+    return "auth/" + hashlib.sha256(token.encode()).hexdigest()
+
+async def resolve_user(token: str) -> Tuple[Dict, Optional[str]]:
+    """
+    Returns the GitHub user and team role of a token.
+
+    Results are cached under a hash of the token for AUTH_CACHE_TTL seconds and concurrent
+    requests with the same token share a single lookup, so bulk edits call GitHub once.
+    """
+    key = user_key(token)
+    cached = await cache.get(key)
+    if cached is not None:
+        entry = json.loads(cached)
+        return entry["user"], entry["role"]
+    if key not in pending:
+        pending[key] = asyncio.ensure_future(lookup_user(token, key))
+        pending[key].add_done_callback(lambda _: pending.pop(key, None))
+    return await asyncio.shield(pending[key])
+
+def token_cipher() -> Fernet:
+    """
+    Cipher keeping the GitHub token inside refresh tokens unreadable to clients.
+    """
+    return Fernet(base64.urlsafe_b64encode(hashlib.sha256(JWT_SECRET.encode()).digest()))
+
+def create_session_tokens(github_token: str, user_data: Dict, team_role: Optional[str]) -> Dict:
+    """
+    Mints a short-lived access JWT carrying the login and team role and a refresh JWT.
+    """
+    now = int(time.time())
+    user = {key: user_data.get(key) for key in ["login", "id", "name"]}
+    access_token = jwt.encode(
+        {"sub": user["login"], "user": user, "role": team_role, "typ": "access", "iat": now, "exp": now + JWT_ACCESS_TTL},
+        JWT_SECRET, algorithm=JWT_ALGORITHM
+    )
+    refresh_token = jwt.encode(
+        {"sub": user["login"], "gh": token_cipher().encrypt(github_token.encode()).decode(), "typ": "refresh",
+         "iat": now, "exp": now + JWT_REFRESH_TTL},
+        JWT_SECRET, algorithm=JWT_ALGORITHM
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "token_type": "bearer",
+        "expires_in": JWT_ACCESS_TTL
+    }
+
+def decode_session_token(token: str, token_type: str) -> Dict:
+    """
+    Verifies the signature, expiry and type of a session JWT.
+    """
+    try:
+        claims = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session token expired.")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication token.")
+    if claims.get("typ") != token_type:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication token.")
+    return claims
+
+async def create_session(github_token: str) -> Dict:
+    """
+    Exchanges a GitHub access token for session tokens.
+
+    Without JWT_SECRET the GitHub token itself is returned and validated against GitHub.
+    """
+    user_data, team_role = await resolve_user(github_token)
+    if not JWT_SECRET:
+        return {"access_token": github_token, "token_type": "bearer"}
+    return create_session_tokens(github_token, user_data, team_role)
+
+async def refresh_session(refresh_token: str) -> Dict:
+    """
+    Exchanges a refresh token for new session tokens, revalidating the user with GitHub.
+
+    The cached user and role are bypassed and replaced, so a revoked team member cannot
+    keep minting access tokens.
+    """
+    if not JWT_SECRET:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Session tokens are not configured.")
+    claims = decode_session_token(refresh_token, "refresh")
+    try:
+        github_token = token_cipher().decrypt(claims["gh"].encode()).decode()
+    except (InvalidToken, KeyError):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication token.")
+    user_data, team_role = await lookup_user(github_token, user_key(github_token))
+    return create_session_tokens(github_token, user_data, team_role)
+
+async def session_user(token: str) -> Tuple[Dict, Optional[str]]:
+    """
+    Returns the user and team role of a bearer token.
+
+    Session JWTs are verified locally, GitHub access tokens are resolved through GitHub.
+    """
+    if JWT_SECRET and token.count(".") == 2:
+        claims = decode_session_token(token, "access")
+        return claims["user"], claims["role"]
+    return await resolve_user(token)
+
+async def check_dataset_permissions(datasets_id: int, session: SessionDep, token: str = Depends(oauth2_scheme)) -> dict:
+    """
+    Checks users permission for endpoints.
+    """
+    user_data, team_role = await session_user(token)
+    if team_role == "maintainer":
+        return user_data
+    elif team_role == "member":
+        # Request username for dataset to verify ownership
+        print(datasets_id)
+        return user_data
     raise HTTPException(status_code=403, detail="Permission denied, user doesn't have sufficient permissions")
 
 async def check_member(token: str = Depends(oauth2_scheme)) -> dict:
     """
     Checks users permission for endpoints.
     """
-    user_data = await get_github_user(token)
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
-    try:
-        team_url = GITHUB_TEAM_MEMBERSHIP_URL.format(username=user_data["login"])
-        team_response = await client.get(team_url, headers=headers)
-        team_role = team_response.json().get('role', 'member')
-        if team_role in ["maintainer", "member"]:
-            return user_data
-    except:
-        pass
+    user_data, team_role = await session_user(token)
+    if team_role in ["maintainer", "member"]:
+        return user_data
     raise HTTPException(status_code=403, detail="Permission denied, user doesn't have sufficient permissions")
 
 async def check_maintainer(token: str = Depends(oauth2_scheme)) -> dict:
     """
     Checks users permission for endpoints.
     """
-    user_data = await get_github_user(token)
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
-    try:
-        team_url = GITHUB_TEAM_MEMBERSHIP_URL.format(username=user_data["login"])
-        team_response = await client.get(team_url, headers=headers)
-        team_role = team_response.json().get('role', 'member')
-        if team_role in ["maintainer"]:
-            return user_data
-    except:
-        pass
-    raise HTTPException(status_code=403, detail="Permission denied, user doesn't have sufficient permissions")
\ No newline at end of file
+    user_data, team_role = await session_user(token)
+    if team_role in ["maintainer"]:
+        return user_data
+    raise HTTPException(status_code=403, detail="Permission denied, user doesn't have sufficient permissions")
+
+async def check_webhook(request: Request) -> bytes:
+    """
+    Verifies a push webhook and returns its body.
+
+    GitHub deliveries are signed with an HMAC-SHA256 of the body (X-Hub-Signature-256),
+    GitLab deliveries carry the secret token (X-Gitlab-Token).
+    """
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Webhooks are not configured")
+    body = await request.body()
+    signature = request.headers.get("x-hub-signature-256")
+    token = request.headers.get("x-gitlab-token")
+    if signature is not None:
+        expected = "sha256=" + hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        if hmac.compare_digest(signature, expected):
+            return body
+    elif token is not None and hmac.compare_digest(token, WEBHOOK_SECRET):
+        return body
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid webhook signature")
@@ -0,0 +1,225 @@
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlencode
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+import threading
+import logging
+import orjson
+import uuid
+import time
+import os
+
+from dotenv import load_dotenv
+
+from app.metrics import record_cache
+
+load_dotenv()
+
+CACHE_URL = os.getenv("CACHE_URL")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "256"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "datalakes:")
+
+
+class LocalCache:
+    """
+    In-process cache backend, a size bounded LRU whose entries expire after ttl seconds.
+
+    Every worker holds its own copy, so table versions are only known to this process and
+    validators carry a token unique to it.
+    """
+
+    def __init__(self, maxsize: int = CACHE_MAXSIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex[:8]
+        self.entries = OrderedDict()
+        self.versions: Dict[str, Tuple[int, float]] = {}
+        self.lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+            record_cache(entry is not None)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    async def get_versions(self, tables: Iterable[str]) -> List[Tuple[int, float]]:
+        """Change counter and last write time of each table"""
+        return [self.versions.get(table, (0, 0.0)) for table in tables]
+
+    async def bump(self, tables: Iterable[str]):
+        now = time.time()
+        with self.lock:
+            for table in tables:
+                self.versions[table] = (self.versions.get(table, (0, 0.0))[0] + 1, now)
+
+    async def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    async def close(self):
+        pass
+
+
+class RedisCache:
+    """
+    Cache backend on a Redis protocol server (Redis, Valkey, KeyDB...) shared by all workers.
+
+    Table versions are Redis counters, so a write in one worker changes the validators and
+    cache keys seen by every other. Read and write errors degrade to cache misses.
+    """
+
+    def __init__(self, url: Optional[str] = None, ttl: float = CACHE_TTL, prefix: str = CACHE_PREFIX, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.redis = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.token = "shared"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            value = await self.redis.get(self.prefix + key)
+        except Exception as e:
+            logging.warning(f"Cache read failed: {e}")
+            value = None
+        record_cache(value is not None)
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        try:
+            await self.redis.set(self.prefix + key, value, px=int(1000 * (self.ttl if ttl is None else ttl)))
+        except Exception as e:
+            logging.warning(f"Cache write failed: {e}")
+
+    async def get_versions(self, tables: Iterable[str]) -> List[Tuple[int, float]]:
+        """Change counter and last write time of each table, zero when Redis cannot be read"""
+        tables = list(tables)
+        try:
+            values = await self.redis.mget(
+                [f"{self.prefix}version:{t}" for t in tables] + [f"{self.prefix}modified:{t}" for t in tables])
+        except Exception as e:
+            logging.warning(f"Cache version read failed: {e}")
+            return [(0, 0.0) for _ in tables]
+        return [(int(values[i] or 0), float(values[len(tables) + i] or 0.0)) for i in range(len(tables))]
+
+    async def bump(self, tables: Iterable[str]):
+        """
+        Increment the table versions. A failed bump is only logged, the write it follows is
+        already committed and cached reads expire within CACHE_TTL anyway.
+        """
+        now = time.time()
+        try:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                for table in tables:
+                    pipe.incr(f"{self.prefix}version:{table}")
+                    pipe.set(f"{self.prefix}modified:{table}", now)
+                await pipe.execute()
+        except Exception as e:
+            logging.warning(f"Cache version bump failed: {e}")
+
+    async def clear(self):
+        async for key in self.redis.scan_iter(match=f"{self.prefix}*"):
+            await self.redis.delete(key)
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_cache(url: Optional[str] = CACHE_URL):
+    """Redis backend when CACHE_URL is set, otherwise the in-process fallback"""
+    if url:
+        return RedisCache(url)
+    return LocalCache()
+
+
+cache = create_cache()
+STARTED = time.time()
+
+
+def json_bytes(content: Any) -> bytes:
+    """Encode content with orjson, numpy arrays natively and models through jsonable_encoder"""
+    return orjson.dumps(content, default=jsonable_encoder, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+async def invalidate(*tables: str):
+    """Record a write to the tables, bumping their versions so cached reads and ETags change"""
+    await cache.bump(tables)
+
+
+async def validators(*tables: str) -> Dict[str, str]:
+    """
+    ETag and Last-Modified headers for a response built from the tables.
+
+    The ETag also includes the current CACHE_TTL period so writes made outside the API are
+    picked up within the same delay as cache expiry.
+    """
+    versions = await cache.get_versions(tables)
+    period = int(time.time() // CACHE_TTL) if CACHE_TTL > 0 else 0
+    tag = "-".join([cache.token, str(period)] + [f"{t}.{v}" for t, (v, _) in zip(tables, versions)])
+    last = datetime.fromtimestamp(int(max([STARTED] + [m for _, m in versions])), tz=timezone.utc)
+    return {
+        "ETag": f'W/"{tag}"',
+        "Last-Modified": format_datetime(last, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
+
+
+def not_modified(request: Request, headers: Dict[str, str]) -> bool:
+    """True when the If-None-Match header of the request matches the ETag in headers"""
+    tags = request.headers.get("if-none-match")
+    if not tags:
+        return False
+    etag = headers["ETag"].removeprefix("W/")
+    return any(t.strip() == "*" or t.strip().removeprefix("W/") == etag for t in tags.split(","))
+
+
+def page_links(request: Request, body: bytes, limit: Optional[int]) -> Dict[str, str]:
+    """Link header to the next keyset page when a JSON page of limit rows is full"""
+    if limit is None:
+        return {}
+    rows = orjson.loads(body)
+    if len(rows) < limit:
+        return {}
+    return {"Link": f'<{request.url.include_query_params(after=rows[-1]["id"])}>; rel="next"'}
+
+
+async def cached_response(request: Request, name: str, tables: List[str], load: Callable[[], Awaitable[Any]],
+                          limit: Optional[int] = None) -> Response:
+    """
+    Serve a catalog read through the cache.
+
+    Answers 304 when the client copy is current, otherwise returns the JSON cached under
+    the current ETag and query string, calling load and caching its encoded result on a
+    miss. load may return JSON bytes built by the database. With limit the body is a keyset
+    page and a Link header points to the next one when the page is full.
+    """
+    headers = await validators(*tables)
+    if not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    key = f"{name}?{urlencode(sorted(request.query_params.multi_items()))}:{headers['ETag']}"
+    body = await cache.get(key)
+    if body is None:
+        body = await load()
+        if not isinstance(body, bytes):
+            body = json_bytes(body)
+        await cache.set(key, body)
+    headers.update(page_links(request, body, limit))
+    return Response(content=body, media_type="application/json", headers=headers)
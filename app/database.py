@@ -1,10 +1,11 @@
 import asyncio
-from sqlalchemy import text
+from sqlalchemy import text, func, select, case, literal_column, ColumnElement, ScalarSelect
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, async_sessionmaker
 from sqlalchemy.pool import NullPool
-from typing import Annotated, AsyncGenerator
-from fastapi import Depends
+from typing import Annotated, AsyncGenerator, Dict, List, Optional
+from fastapi import Depends, HTTPException
 import os
 import logging
 from dotenv import load_dotenv
@@ -17,14 +18,36 @@ DB_DATABASE = os.getenv("DB_DATABASE")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 PRODUCTION = os.getenv("PRODUCTION", "false").lower() == "true"
+DB_POOL = os.getenv("DB_POOL", str(PRODUCTION)).lower() == "true"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))  # Set to 0 behind pgbouncer in transaction mode
 
 DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
 
+if DB_POOL:
+    pool_options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+else:
+    pool_options = {"poolclass": NullPool}
+
 engine: AsyncEngine = create_async_engine(
     DATABASE_URL,
     echo=False,
     future=True,
-    poolclass=NullPool if not PRODUCTION else None
+    connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+    },
+    **pool_options
 )
 
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
@@ -58,6 +81,73 @@ async def check_db_connection(max_retries: int = 3, retry_delay: int = 2) -> boo
                 await asyncio.sleep(retry_delay)
     return False
 
+def pool_status(engine: AsyncEngine = engine) -> dict:
+    """Connections of this worker's pool, all zero when pooling is disabled"""
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return {"size": 0, "checked_in": 0, "checked_out": 0, "overflow": 0}
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0)
+    }
+
+def json_rows(model, *where, columns: Optional[List[str]] = None, after: Optional[int] = None,
+              limit: Optional[int] = None, computed: Optional[Dict[str, ColumnElement]] = None) -> ScalarSelect:
+    """
+    Subquery aggregating the rows of a table model into a JSON array inside Postgres.
+
+    Rows are ordered by id and hold the model's columns (or the given ones), so the result
+    can be sent to clients as is instead of being loaded and serialized row by row. after
+    and limit select a keyset page, the rows with the limit smallest ids above after.
+    computed maps column names to expressions returned in place of the stored values.
+    """
+    table = model.__table__
+    computed = computed or {}
+    selected = [computed[name].label(name) if name in computed else table.c[name]
+                for name in (columns or table.columns.keys())]
+    page = select(*selected).where(*where)
+    if after is not None:
+        page = page.where(table.c.id > after)
+    if limit is not None:
+        page = page.order_by(table.c.id).limit(limit)
+    page = page.subquery()
+    row = func.json_build_object(*[arg for c in selected for arg in (literal_column(f"'{c.name}'"), page.c[c.name])])
+    return (
+        select(func.coalesce(func.json_agg(aggregate_order_by(row, page.c.id)), literal_column("'[]'::json")))
+        .scalar_subquery()
+    )
+
+def projection(model, fields: Optional[List[str]]) -> Optional[List[str]]:
+    """
+    Columns requested with a fields= query parameter, repeated or comma separated.
+
+    id is always included so rows can be told apart and paginated.
+    """
+    if not fields:
+        return None
+    columns = list(dict.fromkeys(["id"] + [f.strip() for field in fields for f in field.split(",") if f.strip()]))
+    unknown = [c for c in columns if c not in model.__table__.c]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return columns
+
+def ordered_range(function, lower, upper):
+    """
+    Closed range between two columns, swapping them when stored the wrong way round.
+
+    Range constructors reject a lower bound above the upper one, a plain expression index
+    would make such writes fail. Missing bounds are unbounded.
+    """
+    inverted = lower > upper
+    return function(case((inverted, upper), else_=lower), case((inverted, lower), else_=upper), literal_column("'[]'"))
+
+def check_order(lower, upper, detail: str):
+    """Reject a query window whose lower bound is above its upper bound"""
+    if lower is not None and upper is not None and lower > upper:
+        raise HTTPException(status_code=400, detail=detail)
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSession(engine) as session:
         yield session
@@ -0,0 +1,75 @@
+from typing import Optional, Tuple
+import numpy as np
+
+
+def bin_edges(start: float, end: float, bins: int, anchor: float = 0.0) -> np.ndarray:
+    """
+    Equal width time bin edges covering [start, end].
+
+    Edges are aligned to a grid starting at anchor so bins stay fixed when a client pans
+    the window, which keeps plots stable and repeated requests cacheable.
+    """
+    width = max((end - start) / bins, 1e-9)
+    first = anchor + np.floor((start - anchor) / width) * width
+    count = int(np.floor((end - first) / width)) + 2
+    return first + np.arange(count) * width
+
+
+def segments(times: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    """Start index of every non-empty bin in sorted times"""
+    starts = np.searchsorted(times, edges[:-1], side="left")
+    ends = np.searchsorted(times, edges[1:], side="left")
+    return starts[ends > starts]
+
+
+def mean_bins(times: np.ndarray, values: np.ndarray, edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Mean time and NaN ignoring mean value of each non-empty bin, values are time first"""
+    starts = segments(times, edges)
+    counts = np.diff(np.append(starts, len(times)))
+    binned_times = np.add.reduceat(times, starts) / counts
+    valid = ~np.isnan(values)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / np.add.reduceat(valid.astype("int64"), starts, axis=0)
+    return binned_times, means
+
+
+def minmax_bins(times: np.ndarray, values: np.ndarray, edges: np.ndarray,
+                maximum_values: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Minimum followed by maximum of each non-empty bin, values are time first.
+
+    When maximum_values is given the minimum is taken from values and the maximum from
+    maximum_values, as when downsampling the min and max of an aggregated pyramid level.
+    """
+    starts = segments(times, edges)
+    counts = np.diff(np.append(starts, len(times)))
+    binned_times = np.repeat(np.add.reduceat(times, starts) / counts, 2)
+    with np.errstate(invalid="ignore"):
+        minimum = np.fmin.reduceat(values, starts, axis=0)
+        maximum = np.fmax.reduceat(values if maximum_values is None else maximum_values, starts, axis=0)
+    binned = np.empty((2 * len(starts),) + values.shape[1:], dtype="float64")
+    binned[0::2] = minimum
+    binned[1::2] = maximum
+    return binned_times, binned
+
+
+def lttb(times: np.ndarray, values: np.ndarray, points: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling of a 1D series"""
+    n = len(times)
+    if points >= n or points < 3:
+        return np.arange(n)
+    values = values.astype("float64")
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    selected = np.empty(points, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        s, e = edges[i], edges[i + 1]
+        ns, ne = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        with np.errstate(invalid="ignore"):
+            avg_t, avg_v = times[ns:ne].mean(), np.nanmean(values[ns:ne])
+        area = np.abs((times[a] - avg_t) * (values[s:e] - values[a]) - (times[a] - times[s:e]) * (avg_v - values[a]))
+        a = s + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = a
+    return selected
@@ -0,0 +1,130 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Collection, Dict, List, Optional
+from sqlmodel import select, delete
+from sqlalchemy.dialects.postgresql import insert
+import numpy as np
+import xarray as xr
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from app.models import Files
+from app.netcdf import dataset_files, repository_datasets, to_epoch, DEFAULT_WINDOW_DAYS
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+
+LATITUDE = ("latitude", "lat")
+LONGITUDE = ("longitude", "lon")
+
+
+def position(ds: xr.Dataset, names) -> Optional[float]:
+    """Mean of the first coordinate variable found, otherwise a global attribute of the same name"""
+    for name in names:
+        if name in ds.variables:
+            values = ds[name].values.astype("float64")
+            return float(np.nanmean(values)) if np.isfinite(values).any() else None
+    for name in names:
+        try:
+            return float(ds.attrs[name])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return None
+
+
+def file_metadata(file: Path, time: str, depth: Optional[str]) -> Dict:
+    """
+    Time and depth bounds and position of a NetCDF file.
+
+    Only the header and the coordinate variables are read, data variables stay on disk.
+    """
+    with xr.open_dataset(file) as ds:
+        times = to_epoch(ds[time].values).ravel()
+        times = times[np.isfinite(times)]
+        metadata = {"mindatetime": None, "maxdatetime": None, "mindepth": None, "maxdepth": None}
+        if times.size:
+            metadata["mindatetime"] = datetime.fromtimestamp(times.min(), tz=timezone.utc)
+            metadata["maxdatetime"] = datetime.fromtimestamp(times.max(), tz=timezone.utc)
+        if depth and depth in ds.variables:
+            depths = ds[depth].values.astype("float64").ravel()
+            depths = depths[np.isfinite(depths)]
+            if depths.size:
+                metadata["mindepth"], metadata["maxdepth"] = float(depths.min()), float(depths.max())
+        metadata["latitude"] = position(ds, LATITUDE)
+        metadata["longitude"] = position(ds, LONGITUDE)
+    return metadata
+
+
+async def index_repository_files(session, repositories_id: int, root: Optional[Path] = None,
+                                 changed: Optional[Collection[str]] = None):
+    """
+    Upsert a files row for every NetCDF file of the datasets of a repository, or of a release at root.
+
+    Filelinks are relative to the repository folder like datasourcelinks. Only files in
+    changed (filelinks, None for all) or without a row are read, rows of files that are
+    gone are deleted.
+    """
+    root = Path(root or f"{FILESYSTEM}/git/{repositories_id}").resolve()
+    changed = None if changed is None else set(changed)
+    # Plain values, a rollback after a failed dataset expires the loaded rows
+    datasets = [(dataset.id, dataset.datasourcelink, dataset.fileconnect, time, depth)
+                for dataset, time, depth, _ in await repository_datasets(session, repositories_id)]
+    for datasets_id, datasourcelink, fileconnect, time, depth in datasets:
+        try:
+            files = dataset_files(repositories_id, datasourcelink, fileconnect, root=root)
+            links = {file.relative_to(root).as_posix(): file for file in files}
+            result = await session.execute(select(Files.filelink).where(Files.datasets_id == datasets_id))
+            indexed = set(result.scalars().all())
+            scan = [link for link in links if changed is None or link in changed or link not in indexed]
+            rows = []
+            for link in scan:
+                metadata = await asyncio.to_thread(file_metadata, links[link], time, depth)
+                rows.append({"datasets_id": datasets_id, "filelink": link, "filetype": "nc", **metadata})
+            if rows:
+                statement = insert(Files)
+                await session.execute(statement.on_conflict_do_update(
+                    index_elements=["datasets_id", "filelink"],
+                    set_={key: statement.excluded[key] for key in rows[0] if key not in ("datasets_id", "filelink")}
+                ), rows)
+            gone = indexed - set(links)
+            if gone:
+                await session.execute(delete(Files).where(Files.datasets_id == datasets_id, Files.filelink.in_(gone)))
+            await session.commit()
+            if rows or gone:
+                logging.info(f"Indexed {len(rows)} files and removed {len(gone)} for dataset {datasets_id}")
+        except Exception as e:
+            await session.rollback()
+            logging.error(f"Error indexing files of dataset {datasets_id}: {e}")
+
+
+async def window_files(session, repositories_id: int, datasets_id: int, start: Optional[datetime] = None,
+                       end: Optional[datetime] = None) -> Optional[List[Path]]:
+    """
+    Return the files of a dataset that overlap [start, end], defaulting to the last window of data.
+
+    Returns None when the dataset has no indexed files or an indexed file is missing, the
+    caller then lists the files on disk.
+    """
+    latest = select(Files.filelink, Files.maxdatetime).where(
+        Files.datasets_id == datasets_id, Files.maxdatetime.is_not(None)
+    ).order_by(Files.maxdatetime.desc()).limit(1)
+    last = (await session.exec(latest)).first()
+    if last is None:
+        return None
+    end = last.maxdatetime if end is None else datetime.fromtimestamp(end.timestamp(), tz=timezone.utc)
+    start = end - timedelta(days=DEFAULT_WINDOW_DAYS) if start is None \
+        else datetime.fromtimestamp(start.timestamp(), tz=timezone.utc)
+    result = await session.exec(
+        select(Files.filelink)
+        .where(Files.datasets_id == datasets_id, Files.mindatetime <= end, Files.maxdatetime >= start)
+        .order_by(Files.mindatetime, Files.filelink)
+    )
+    root = Path(f"{FILESYSTEM}/git/{repositories_id}").resolve()
+    files = [root / link for link in (result.all() or [last.filelink])]
+    if not all(file.is_file() for file in files):
+        return None
+    return files
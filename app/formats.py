@@ -0,0 +1,105 @@
+from typing import Dict, Iterator
+import pyarrow.parquet as pq
+import pyarrow as pa
+import numpy as np
+import io
+import os
+
+from dotenv import load_dotenv
+
+from app.netcdf import Window
+
+load_dotenv()
+
+BLOCK_SIZE = int(os.getenv("DATA_BLOCK_SIZE", "10000"))
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class Sink(io.RawIOBase):
+    """Writable file object whose written bytes are collected and drained between blocks"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.chunks.append(bytes(b))
+        self.position += len(b)
+        return len(b)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def record_batch(columns: Dict[str, np.ndarray]) -> pa.RecordBatch:
+    return pa.RecordBatch.from_pydict({name: pa.array(values) for name, values in columns.items()})
+
+
+def stream_csv(window: Window) -> Iterator[bytes]:
+    """Stream a window as CSV, one block of timesteps at a time"""
+    try:
+        yield (",".join(window.keep) + "\n").encode()
+        for columns in window.blocks(BLOCK_SIZE):
+            buffer = io.StringIO()
+            np.savetxt(buffer, np.column_stack(list(columns.values())), delimiter=",", fmt="%.15g")
+            yield buffer.getvalue().replace("nan", "").encode()
+    finally:
+        window.close()
+
+
+def stream_arrow(window: Window) -> Iterator[bytes]:
+    """Stream a window as an Apache Arrow IPC stream with one record batch per block"""
+    sink = Sink()
+    writer = None
+    try:
+        for columns in window.blocks(BLOCK_SIZE):
+            batch = record_batch(columns)
+            if writer is None:
+                writer = pa.ipc.new_stream(sink, batch.schema)
+            writer.write_batch(batch)
+            yield sink.drain()
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, pa.schema([(name, pa.float64()) for name in window.keep]))
+        writer.close()
+        yield sink.drain()
+    finally:
+        window.close()
+
+
+def stream_parquet(window: Window) -> Iterator[bytes]:
+    """Stream a window as Parquet with one row group per block"""
+    sink = Sink()
+    writer = None
+    try:
+        for columns in window.blocks(BLOCK_SIZE):
+            table = pa.Table.from_batches([record_batch(columns)])
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table)
+            yield sink.drain()
+        if writer is None:
+            writer = pq.ParquetWriter(sink, pa.schema([(name, pa.float64()) for name in window.keep]))
+        writer.close()
+        yield sink.drain()
+    finally:
+        window.close()
+
+
+STREAMS = {
+    "csv": stream_csv,
+    "arrow": stream_arrow,
+    "parquet": stream_parquet,
+}
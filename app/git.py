@@ -0,0 +1,155 @@
+from pathlib import Path, PurePosixPath
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import shutil
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# History and blobs that are not served are never downloaded: by default clones are
+# shallow (GIT_CLONE_DEPTH commits, 0 for full history), partial (GIT_CLONE_FILTER, empty
+# to disable) and only check out the files referenced by datasets (GIT_SPARSE_CHECKOUT).
+GIT_CLONE_DEPTH = int(os.getenv("GIT_CLONE_DEPTH", "1"))
+GIT_CLONE_FILTER = os.getenv("GIT_CLONE_FILTER", "blob:none")
+GIT_SPARSE_CHECKOUT = os.getenv("GIT_SPARSE_CHECKOUT", "true").lower() == "true"
+
+
+class Changes(NamedTuple):
+    """
+    Commits of a working tree before and after an update and the files changed between
+    them, relative to the working tree. files is None when everything must be treated as
+    changed, after a clone or when the sparse checkout changed.
+    """
+    old: Optional[str]
+    new: str
+    files: Optional[List[str]]
+
+    def touches(self, pattern: Optional[str]) -> bool:
+        """
+        True when a changed file matches a sparse pattern, a file or the direct children of a
+        folder. Files without a pattern (outside the repository) are always treated as changed.
+        """
+        if self.files is None or pattern is None:
+            return True
+        for file in self.files:
+            path = f"/{file}"
+            if path == pattern or (pattern.endswith("/") and path.startswith(pattern) and "/" not in path[len(pattern):]):
+                return True
+        return False
+
+
+async def git(*args: str) -> str:
+    """Run a git command, returning its output and raising RuntimeError when it fails"""
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"Git {args[0] if args[0] != '-C' else args[2]} failed: {stderr.decode()}")
+    return stdout.decode()
+
+
+def source_pattern(name: str, datasourcelink: Optional[str], fileconnect: Optional[str]) -> Optional[str]:
+    """
+    Sparse checkout pattern of the files of a dataset, None when they are not in the repository.
+
+    Links are relative to the folder that holds the working tree and start with the
+    repository name. Datasets split over files (fileconnect) need their whole folder,
+    others a single file.
+    """
+    if not datasourcelink:
+        return None
+    parts = PurePosixPath(datasourcelink).parts
+    if len(parts) < 2 or parts[0] != name or ".." in parts:
+        return None
+    path = PurePosixPath(*parts[1:])
+    if fileconnect:
+        folder = path if not path.suffix else path.parent
+        return "/" if folder == PurePosixPath(".") else f"/{folder}/"
+    return f"/{path}"
+
+
+def sparse_paths(name: str, sources: Iterable[Tuple[Optional[str], Optional[str]]]) -> List[str]:
+    """Sparse checkout patterns of the (datasourcelink, fileconnect) pairs of the datasets of a repository"""
+    return sorted({p for p in (source_pattern(name, *source) for source in sources) if p is not None})
+
+
+async def sparse_patterns(repo_path: str) -> List[str]:
+    """Current sparse checkout patterns of a working tree, empty when it is checked out in full"""
+    try:
+        return sorted(line for line in (await git("-C", repo_path, "sparse-checkout", "list")).splitlines() if line)
+    except RuntimeError:
+        return []
+
+
+async def set_sparse_checkout(repo_path: str, paths: List[str]):
+    """Limit the working tree to paths, or check out everything when there are none"""
+    if GIT_SPARSE_CHECKOUT and paths:
+        await git("-C", repo_path, "sparse-checkout", "set", "--no-cone", *paths)
+    elif await sparse_patterns(repo_path):
+        await git("-C", repo_path, "sparse-checkout", "disable")
+
+
+async def head(repo_path: str) -> str:
+    """Commit checked out in a working tree"""
+    return (await git("-C", repo_path, "rev-parse", "HEAD")).strip()
+
+
+async def clone_repository(ssh: str, repo_path: str, branch: Optional[str] = None,
+                           paths: Optional[List[str]] = None) -> Changes:
+    """Clone a branch of a repository, removing the partial working tree when the clone fails"""
+    args = ["clone", "--no-checkout"]
+    if GIT_CLONE_DEPTH > 0:
+        args += ["--depth", str(GIT_CLONE_DEPTH)]
+    if GIT_CLONE_FILTER:
+        args += [f"--filter={GIT_CLONE_FILTER}"]
+    if branch:
+        args += ["--branch", branch]
+    try:
+        await git(*args, ssh, repo_path)
+        await set_sparse_checkout(repo_path, paths or [])
+        await git("-C", repo_path, "checkout")
+    except Exception:
+        if Path(repo_path).exists():
+            try:
+                shutil.rmtree(repo_path)
+                logging.info(f"Cleaned up failed clone at {repo_path}")
+            except Exception as cleanup_error:
+                logging.error(f"Failed to cleanup directory {repo_path}: {cleanup_error}")
+        raise
+    logging.info(f"Cloning successful")
+    return Changes(None, await head(repo_path), None)
+
+
+async def pull_repository(repo_path: str, branch: Optional[str] = None,
+                          paths: Optional[List[str]] = None) -> Changes:
+    """
+    Update the working tree to the tip of branch (the remote default branch when None).
+
+    The tip is fetched with the clone depth and the tree reset to it, so force pushes and
+    branch changes are followed. The sparse checkout is updated first as datasets may have
+    been added since the last pull. Returns the files changed between the old and new
+    HEAD, the tree diff needs no common history so this works on shallow clones.
+    """
+    old = await head(repo_path)
+    args = ["-C", repo_path, "fetch"]
+    if GIT_CLONE_DEPTH > 0:
+        args += ["--depth", str(GIT_CLONE_DEPTH)]
+    await git(*args, "origin", branch or "HEAD")
+    resparsed = await sparse_patterns(repo_path) != (sorted(paths or []) if GIT_SPARSE_CHECKOUT else [])
+    await set_sparse_checkout(repo_path, paths or [])
+    await git("-C", repo_path, "reset", "--hard", "FETCH_HEAD")
+    new = await head(repo_path)
+    if resparsed:
+        files = None
+    elif old == new:
+        files = []
+    else:
+        files = (await git("-C", repo_path, "diff", "--name-only", "--no-renames", old, new)).splitlines()
+    logging.info(f"Pulling successful, {old[:8]}..{new[:8]} changed {'all' if files is None else len(files)} files")
+    return Changes(old, new, files)
@@ -0,0 +1,237 @@
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlmodel import select, update, and_, or_, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from app.database import async_session_maker, engine
+from app.models import Jobs
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_CHANNEL = "jobs"
+
+handlers: Dict[str, Callable[[Jobs], Awaitable[None]]] = {}
+
+
+def handler(kind: str):
+    """Register the coroutine function running the jobs of a kind, it receives the claimed job"""
+    def register(function):
+        handlers[kind] = function
+        return function
+    return register
+
+
+async def enqueue(kind: str, repositories_id: int, payload: Optional[dict] = None, delay: float = 0.0) -> Jobs:
+    """
+    Queue a job for a repository and wake the workers, the worker process listens on JOB_CHANNEL.
+
+    When a job of the same kind is already queued for the repository that job is returned
+    instead, brought forward if the new one would run earlier.
+    """
+    now = func.now()
+    statement = insert(Jobs).values(
+        kind=kind,
+        repositories_id=repositories_id,
+        payload=payload or {},
+        status="queued",
+        attempts=0,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        run_at=now + timedelta(seconds=delay),
+        created=now,
+        updated=now
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=["kind", "repositories_id"],
+        index_where=Jobs.status == "queued",
+        set_={"run_at": func.least(Jobs.run_at, statement.excluded.run_at), "updated": now}
+    ).returning(Jobs.id)
+    async with async_session_maker() as session:
+        jobs_id = (await session.execute(statement)).scalar_one()
+        await session.execute(select(func.pg_notify(JOB_CHANNEL, kind)))
+        await session.commit()
+        job = await session.get(Jobs, jobs_id)
+    pool.notify()
+    return job
+
+
+async def claim(session) -> Optional[Jobs]:
+    """
+    Lease the next runnable job, or None.
+
+    Queued jobs that are due and running jobs whose lease expired (their worker died) are
+    runnable, unless another job of the same repository holds a live lease. Rows leased by
+    concurrent workers are skipped rather than waited for.
+    """
+    job, running = aliased(Jobs, name="job"), aliased(Jobs, name="running")
+    now = func.now()
+    busy = select(running.id).where(
+        running.repositories_id == job.repositories_id,
+        running.status == "running",
+        running.locked_until >= now,
+        running.id != job.id
+    ).exists()
+    candidate = (
+        select(job.id)
+        .where(or_(and_(job.status == "queued", job.run_at <= now),
+                   and_(job.status == "running", job.locked_until < now)))
+        .where(~busy)
+        .order_by(job.run_at, job.id)
+        .limit(1)
+        .with_for_update(of=job, skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        update(Jobs)
+        .where(Jobs.id == candidate)
+        .values(status="running", attempts=Jobs.attempts + 1, locked_until=now + timedelta(seconds=JOB_LEASE), updated=now)
+        .returning(Jobs)
+        .execution_options(synchronize_session=False)
+    )
+    return result.scalar_one_or_none()
+
+
+async def finish(job: Jobs, error: Optional[str] = None):
+    """Mark a job done, or queue it again with exponential backoff while attempts remain"""
+    now = func.now()
+    values = {"status": "success", "error": None, "locked_until": None, "updated": now}
+    if error is not None:
+        values.update(status="failed", error=error)
+        if job.attempts < job.max_attempts:
+            values.update(status="queued", run_at=now + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1)))
+    async with async_session_maker() as session:
+        try:
+            await session.execute(update(Jobs).where(Jobs.id == job.id).values(**values))
+            await session.commit()
+        except IntegrityError:
+            # A newer job of the same kind is already queued for the repository, it replaces the retry
+            await session.rollback()
+            await session.execute(update(Jobs).where(Jobs.id == job.id).values(**{**values, "status": "failed"}))
+            await session.commit()
+
+
+async def keep_lease(jobs_id: int):
+    """Extend the lease of a running job until cancelled"""
+    while True:
+        await asyncio.sleep(JOB_LEASE / 3)
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Jobs)
+                .where(Jobs.id == jobs_id, Jobs.status == "running")
+                .values(locked_until=func.now() + timedelta(seconds=JOB_LEASE))
+            )
+            await session.commit()
+
+
+async def run(job: Jobs):
+    """Run a claimed job with its handler, recording the outcome"""
+    if job.kind not in handlers:
+        await finish(job, error=f"No handler for jobs of kind {job.kind}")
+        return
+    if job.attempts > job.max_attempts:
+        await finish(job, error=job.error or "Lease expired")
+        return
+    lease = asyncio.create_task(keep_lease(job.id))
+    try:
+        await handlers[job.kind](job)
+    except asyncio.CancelledError:
+        # Shutting down, release the lease so another worker picks the job up straight away
+        async with async_session_maker() as session:
+            await session.execute(update(Jobs).where(Jobs.id == job.id).values(locked_until=func.now()))
+            await session.commit()
+        raise
+    except Exception as e:
+        logging.error(f"Job {job.id} ({job.kind}) attempt {job.attempts} of {job.max_attempts} failed: {e}")
+        await finish(job, error=str(e))
+    else:
+        await finish(job)
+    finally:
+        lease.cancel()
+
+
+class WorkerPool:
+    """
+    A bounded number of worker tasks in the event loop of this process.
+
+    The pool runs in the worker process (app.worker), never in the API processes. Workers
+    poll the jobs table every JOB_POLL_INTERVAL seconds and are woken straight away by
+    notifications on JOB_CHANNEL. Several worker processes can run, leasing with SKIP
+    LOCKED keeps them from running the same job.
+    """
+
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self.tasks: List[asyncio.Task] = []
+        self.loop = None
+        self.wakeup = None
+
+    def start(self):
+        """Start the missing workers"""
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            self.loop, self.tasks, self.wakeup = loop, [], asyncio.Event()
+        self.tasks = [t for t in self.tasks if not t.done()]
+        while len(self.tasks) < self.size:
+            self.tasks.append(loop.create_task(self.work()))
+
+    def notify(self):
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def listen(self):
+        """Wake the workers on notifications from enqueue in any process, until cancelled"""
+        while True:
+            try:
+                async with engine.connect() as connection:
+                    raw = (await connection.get_raw_connection()).driver_connection
+                    listener = lambda *args: self.notify()
+                    await raw.add_listener(JOB_CHANNEL, listener)
+                    try:
+                        await asyncio.Event().wait()
+                    finally:
+                        if not raw.is_closed():
+                            await raw.remove_listener(JOB_CHANNEL, listener)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Polling keeps the jobs running meanwhile
+                logging.error(f"Lost the connection listening for jobs: {e}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def work(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                async with async_session_maker() as session:
+                    job = await claim(session)
+                    await session.commit()
+            except Exception as e:
+                logging.error(f"Failed to claim a job: {e}")
+                job = None
+            if job is not None:
+                await run(job)
+                continue
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+
+pool = WorkerPool()
@@ -1,6 +1,6 @@
 from typing import Annotated
 from fastapi import FastAPI, Request, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -12,7 +12,9 @@ import sentry_sdk
 from dotenv import load_dotenv
 
 import app.auth as auth
-from app.routes import selectiontables, datasets, repositories, datasetparameters, maintenance
+from app.routes import selectiontables, datasets, repositories, datasetparameters, maintenance, data, jobs
+from app.cache import cache
+from app.metrics import PrometheusMiddleware, render_metrics, mark_process_dead, CONTENT_TYPE
 from app.database import (
     check_db_connection,
     engine,
@@ -29,11 +31,12 @@ logging.basicConfig(
 
 GITHUB_CLIENT_ID = os.getenv("GITHUB_CLIENT_ID")
 PRODUCTION = os.getenv("PRODUCTION", "false").lower() == "true"
+SENTRY_TRACES_SAMPLE_RATE = float(os.getenv("SENTRY_TRACES_SAMPLE_RATE", "0.05"))
 
 if PRODUCTION:
     sentry_sdk.init(
         dsn="https://71eb5021a774490f9e1c273e06fc33de@o1106970.ingest.us.sentry.io/4509836725125120",
-        traces_sample_rate=1.0,
+        traces_sample_rate=SENTRY_TRACES_SAMPLE_RATE,
     )
 
 origins = [
@@ -77,12 +80,15 @@ async def lifespan(app: FastAPI):
 
     logging.info("Shutting down application...")
     await engine.dispose()
+    await cache.close()
+    mark_process_dead()
     logging.info("Database connections closed")
     logging.info("Shutdown complete.")
 
 app = FastAPI(
     title="Datalakes API",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     description=description,
     swagger_ui_init_oauth={
         "clientId": GITHUB_CLIENT_ID,
@@ -114,6 +120,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.add_middleware(PrometheusMiddleware)
 
 @app.exception_handler(ValueError)
 async def value_error_exception_handler(request: Request, exc: ValueError):
@@ -129,6 +136,10 @@ def welcome():
     return {"Welcome to the Datalakes API from Eawag. Navigate to /docs or /redoc for documentation. For "
             "queries please contact James Runnalls (james.runnall@eawag.ch)."}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
 @app.post("/api/auth/token", tags=["Authentication"], summary="Swagger UI OAuth2 Token Exchange", include_in_schema=False)
 async def github_token(
     code: Annotated[str, Form(..., description="The authorization code from GitHub.")]
@@ -139,10 +150,22 @@ async def github_token(
     It returns a token in the format expected by Swagger UI's authorization flow.
     """
     token = await auth.get_access_token(code)
-    return {"access_token": token, "token_type": "bearer"}
+    return await auth.create_session(token)
+
+@app.post("/api/auth/refresh", tags=["Authentication"], summary="Refresh Session Token")
+async def refresh_token(
+    refresh_token: Annotated[str, Form(..., description="The refresh token returned with the session token.")]
+):
+    """
+    Exchanges a refresh token for a new short-lived session token.
+    The user's team role is revalidated with GitHub.
+    """
+    return await auth.refresh_session(refresh_token)
 
 app.include_router(datasets.router)
 app.include_router(repositories.router)
 app.include_router(datasetparameters.router)
 app.include_router(selectiontables.router)
 app.include_router(maintenance.router)
+app.include_router(data.router)
+app.include_router(jobs.router)
@@ -0,0 +1,124 @@
+from contextvars import ContextVar
+from typing import List, Optional
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+from sqlalchemy import event
+import time
+import os
+
+from dotenv import load_dotenv
+
+from app.database import engine, pool_status
+
+load_dotenv()
+
+# With PROMETHEUS_MULTIPROC_DIR set every uvicorn worker writes its samples to that folder
+# and /metrics aggregates all of them, whichever worker answers the scrape.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (100, 1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+REQUESTS = Counter("datalakes_http_requests_total", "HTTP requests", ["method", "route", "status"])
+LATENCY = Histogram("datalakes_http_request_duration_seconds", "HTTP request latency", ["method", "route"],
+                    buckets=LATENCY_BUCKETS)
+RESPONSE_SIZE = Histogram("datalakes_http_response_size_bytes", "HTTP response body size", ["method", "route"],
+                          buckets=SIZE_BUCKETS)
+DB_TIME = Histogram("datalakes_db_query_duration_seconds", "Database time spent per request", ["route"],
+                    buckets=LATENCY_BUCKETS)
+CACHE = Counter("datalakes_cache_requests_total", "Cache lookups", ["route", "result"])
+POOL = {
+    key: Gauge(f"datalakes_db_pool_{key}", description, multiprocess_mode="liveall")
+    for key, description in {
+        "size": "Connections kept open by the database pool",
+        "checked_in": "Idle connections in the database pool",
+        "checked_out": "Database connections in use",
+        "overflow": "Database connections open beyond the pool size",
+    }.items()
+}
+
+# Mutable per-request state shared with the database and cache hooks below
+request_state: ContextVar[Optional[dict]] = ContextVar("request_state", default=None)
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    state = request_state.get()
+    if state is not None:
+        state["db_time"] += elapsed
+
+
+def record_cache(hit: bool):
+    """Count a cache lookup against the route of the current request"""
+    state = request_state.get()
+    if state is not None:
+        state["cache"].append(hit)
+
+
+def record_pool():
+    for key, value in pool_status().items():
+        POOL[key].set(value)
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording count, latency, response size, database time and cache
+    lookups of every request, labelled with the route template rather than the path.
+    """
+
+    def __init__(self, app, exclude: List[str] = ("/metrics",)):
+        self.app = app
+        self.exclude = exclude
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude:
+            await self.app(scope, receive, send)
+            return
+
+        state = {"status": 500, "size": 0, "db_time": 0.0, "cache": []}
+        token = request_state.set(state)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["size"] += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_state.reset(token)
+            route = scope["route"].path if "route" in scope else "<unmatched>"
+            method = scope["method"]
+            REQUESTS.labels(method, route, str(state["status"])).inc()
+            LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            RESPONSE_SIZE.labels(method, route).observe(state["size"])
+            DB_TIME.labels(route).observe(state["db_time"])
+            for hit in state["cache"]:
+                CACHE.labels(route, "hit" if hit else "miss").inc()
+            record_pool()
+
+
+def render_metrics() -> bytes:
+    """Metrics of all workers in Prometheus text format"""
+    record_pool()
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Drop this worker's live gauges from the aggregated metrics"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
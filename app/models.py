@@ -1,6 +1,7 @@
 from sqlmodel import SQLModel, Field, Column
 from sqlalchemy.types import TIMESTAMP, JSON
-from pydantic import field_validator
+from sqlalchemy import Index, text
+from pydantic import field_validator, model_validator
 from typing import Optional
 from datetime import datetime
 
@@ -57,7 +58,7 @@ class DatasetsUpdate(DatasetsBase):
     maxdatetime: Optional[datetime] = None
 
 class RepositoriesBase(SQLModel):
-    ssh: str = Field(..., description="SSH URL for git repository (git@host:user/repo.git format)")
+    ssh: str = Field(..., index=True, description="SSH URL for git repository (git@host:user/repo.git format)")
     branch: Optional[str] = None
 
     @classmethod
@@ -84,6 +85,46 @@ class Repositories(RepositoriesBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     status: Optional[str] = None
 
+class Files(SQLModel, table=True):
+    __tablename__ = "files"
+    __table_args__ = (
+        Index("ix_files_mindatetime_maxdatetime", "mindatetime", "maxdatetime"),
+        Index("ix_files_datasets_id_filelink", "datasets_id", "filelink", unique=True),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    datasets_id: Optional[int] = Field(default=None, index=True)
+    filelink: Optional[str] = None
+    filetype: Optional[str] = None
+    filelineage: Optional[int] = None
+    mindatetime: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+    maxdatetime: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+    mindepth: Optional[float] = None
+    maxdepth: Optional[float] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    connect: Optional[str] = None
+    parameters_connectid: Optional[int] = None
+
+class Jobs(SQLModel, table=True):
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # At most one queued job of each kind per repository, enqueueing again returns it
+        Index("ix_jobs_queued", "kind", "repositories_id", unique=True, postgresql_where=text("status = 'queued'")),
+        Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str
+    repositories_id: int = Field(index=True)
+    payload: Optional[dict] = Field(default=None, sa_column=Column(JSON))
+    status: str = "queued"
+    attempts: int = 0
+    max_attempts: int = 1
+    error: Optional[str] = None
+    run_at: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+    locked_until: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+    created: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+    updated: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
+
 class MaintenanceBase(SQLModel):
     depths: Optional[str] = None
     description: Optional[str] = None
@@ -92,6 +133,11 @@ class MaintenanceBase(SQLModel):
     issue: Optional[str] = None
     request: Optional[str] = None
 
+def check_period(starttime: Optional[datetime], endtime: Optional[datetime]):
+    """Raise ValueError when a period ends before it starts"""
+    if starttime is not None and endtime is not None and starttime.timestamp() > endtime.timestamp():
+        raise ValueError("starttime must not be after endtime")
+
 class MaintenanceCreate(MaintenanceBase):
     datasets_id: int
     parameters_id: int
@@ -99,6 +145,11 @@ class MaintenanceCreate(MaintenanceBase):
     starttime: Optional[datetime] = None
     endtime: Optional[datetime] = None
 
+    @model_validator(mode="after")
+    def validate_period(self):
+        check_period(self.starttime, self.endtime)
+        return self
+
 class MaintenanceUpdate(MaintenanceBase):
     datasets_id: Optional[int] = None
     parameters_id: Optional[int] = None
@@ -106,17 +157,23 @@ class MaintenanceUpdate(MaintenanceBase):
     starttime: Optional[datetime] = None
     endtime: Optional[datetime] = None
 
+    @model_validator(mode="after")
+    def validate_period(self):
+        check_period(self.starttime, self.endtime)
+        return self
+
 class Maintenance(MaintenanceBase, table=True):
     __tablename__ = "maintenance"
+    __table_args__ = (Index("ix_maintenance_starttime_endtime", "starttime", "endtime"),)
     id: Optional[int] = Field(default=None, primary_key=True)
-    datasets_id: int
+    datasets_id: int = Field(index=True)
     parameters_id: int
     datasetparameters_id: int
     starttime: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
     endtime: Optional[datetime] = Field(default=None, sa_type=TIMESTAMP(timezone=True))
 
 class DatasetparametersBase(SQLModel):
-    datasets_id: int
+    datasets_id: int = Field(index=True)
     parameters_id: int
     sensors_id: Optional[int] = None
     axis: str
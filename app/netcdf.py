@@ -0,0 +1,316 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from functools import lru_cache
+from pathlib import Path
+import numpy as np
+import xarray as xr
+import fsspec
+import os
+
+from sqlmodel import select
+
+from app.models import Datasets, Datasetparameters
+from app.downsample import bin_edges, mean_bins, minmax_bins, lttb
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+DEFAULT_WINDOW_DAYS = int(os.getenv("DATA_DEFAULT_WINDOW_DAYS", "30"))
+
+TIME_PARAMETER_ID = 1
+DEPTH_PARAMETER_ID = 2
+
+
+class Source(NamedTuple):
+    """A NetCDF file or a group within a VirtualZarr reference store"""
+    path: Path
+    group: Optional[str] = None
+
+
+def parameter_axes(parameters: List[Datasetparameters]) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """Time, depth and remaining parseparameters of a dataset"""
+    time = next((p.parseparameter for p in parameters if p.parameters_id == TIME_PARAMETER_ID), None)
+    depth = next((p.parseparameter for p in parameters if p.parameters_id == DEPTH_PARAMETER_ID), None)
+    variables = [p.parseparameter for p in parameters if p.parseparameter not in (time, depth)]
+    return time, depth, variables
+
+
+async def repository_datasets(session, repositories_id: int) -> List[Tuple[Datasets, str, Optional[str], List[str]]]:
+    """Datasets of a repository that have a data source, with their time, depth and other parseparameters"""
+    result = await session.execute(select(Datasets).where(Datasets.repositories_id == repositories_id))
+    sourced = [dataset for dataset in result.scalars().all() if dataset.datasourcelink]
+    if not sourced:
+        return []
+    result = await session.execute(
+        select(Datasetparameters)
+        .where(Datasetparameters.datasets_id.in_([dataset.id for dataset in sourced]))
+        .order_by(Datasetparameters.id)
+    )
+    parameters = {}
+    for parameter in result.scalars().all():
+        parameters.setdefault(parameter.datasets_id, []).append(parameter)
+    datasets = []
+    for dataset in sourced:
+        time, depth, variables = parameter_axes(parameters.get(dataset.id, []))
+        if time is not None:
+            datasets.append((dataset, time, depth, variables))
+    return datasets
+
+
+@lru_cache(maxsize=32)
+def reference_filesystem(path: str, mtime: int):
+    """Parsed VirtualZarr reference store, cached until the store is rewritten"""
+    return fsspec.filesystem("reference", fo=path, skip_instance_cache=True)
+
+
+def open_source(source: Source, chunks: Optional[dict] = None) -> xr.Dataset:
+    """Lazily open a NetCDF file or VirtualZarr reference store"""
+    if source.path.suffix == ".json":
+        fs = reference_filesystem(str(source.path), source.path.stat().st_mtime_ns)
+        return xr.open_dataset(fs.get_mapper(source.group or ""), engine="zarr", consolidated=False, chunks=chunks)
+    return xr.open_dataset(source.path, group=source.group, chunks=chunks)
+
+
+def dataset_files(repositories_id: int, datasourcelink: str, fileconnect: Optional[str] = None,
+                  root: Optional[Path] = None) -> List[Path]:
+    """
+    List the NetCDF files that make up a dataset.
+
+    The datasourcelink is relative to the repository folder `{FILESYSTEM}/git/{repositories_id}`,
+    or to root when listing the files of a release that is not live yet.
+    Datasets with a fileconnect are split over multiple files in the same folder.
+    """
+    root = Path(root or f"{FILESYSTEM}/git/{repositories_id}").resolve()
+    link = (root / datasourcelink).resolve()
+    if not link.is_relative_to(root):
+        raise ValueError(f"Datasource link {datasourcelink} is outside of repository {repositories_id}")
+    if fileconnect:
+        folder = link if link.is_dir() else link.parent
+        return sorted(folder.glob("*.nc"))
+    return [link] if link.is_file() else []
+
+
+def to_epoch(values: np.ndarray) -> np.ndarray:
+    """Convert decoded datetime64 values to seconds since 1970-01-01"""
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype("datetime64[ns]").astype("int64") / 1e9
+    return values.astype("float64")
+
+
+def window_indices(values: np.ndarray, start: Optional[float], end: Optional[float]) -> slice:
+    """Return the contiguous index slice of a sorted axis within [start, end]"""
+    i0 = 0 if start is None else int(np.searchsorted(values, start, side="left"))
+    i1 = len(values) if end is None else int(np.searchsorted(values, end, side="right"))
+    return slice(i0, max(i0, i1))
+
+
+class Window:
+    """
+    A time (and depth) window of the requested variables over a set of sources.
+
+    Sources are opened lazily and only the selected variables are kept, so only the
+    chunks inside the window are read from disk when the window is loaded or iterated.
+    When no window is provided the last window_days days of data are selected, or the
+    whole record when window_days is None. With extremes the `{variable}_min` and
+    `{variable}_max` companions of pyramid levels are selected for minmax downsampling.
+    """
+
+    def __init__(
+            self,
+            sources: List[Source],
+            variables: List[str],
+            time: str,
+            depth: Optional[str] = None,
+            start: Optional[datetime] = None,
+            end: Optional[datetime] = None,
+            mindepth: Optional[float] = None,
+            maxdepth: Optional[float] = None,
+            window_days: Optional[float] = DEFAULT_WINDOW_DAYS,
+            extremes: bool = False):
+        self.time = time
+        self.depth = depth
+        self.keep = list(dict.fromkeys([time] + ([depth] if depth else []) + variables))
+        self.extremes = {v: (f"{v}_min", f"{v}_max") for v in variables} if extremes else {}
+        self.opened = [open_source(source, chunks={}) for source in sources]
+        try:
+            self._select(sources, start, end, mindepth, maxdepth, window_days)
+        except Exception:
+            self.close()
+            raise
+
+    def _select(self, sources, start, end, mindepth, maxdepth, window_days):
+        keep = self.keep + [e for pair in self.extremes.values() for e in pair]
+        missing = [v for v in keep if v not in self.opened[0].variables]
+        if missing:
+            raise KeyError(f"Variables {', '.join(missing)} not found in {sources[0].path.name}")
+        self.time_dim = self.opened[0][self.time].dims[0]
+        self.depth_dim = self.opened[0][self.depth].dims[0] if self.depth else None
+        ds = xr.combine_nested(
+            [o[keep] for o in self.opened],
+            concat_dim=self.time_dim,
+            data_vars="minimal",
+            coords="minimal",
+            compat="override",
+            join="outer",
+            combine_attrs="override"
+        )
+        times = to_epoch(ds[self.time].values)
+        order = None
+        if len(times) > 1 and np.any(np.diff(times) < 0):
+            order = np.argsort(times, kind="stable")
+            times = times[order]
+
+        end_s = start_s = None
+        if end is not None:
+            end_s = end.timestamp()
+        elif len(times) > 0:
+            end_s = float(np.nanmax(times))
+        if start is not None:
+            start_s = start.timestamp()
+        elif end_s is not None and window_days is not None:
+            start_s = end_s - timedelta(days=window_days).total_seconds()
+        t_index = window_indices(times, start_s, end_s)
+        selection = {self.time_dim: t_index if order is None else order[t_index]}
+
+        if self.depth:
+            depths = ds[self.depth].values.astype("float64")
+            selection[self.depth_dim] = np.flatnonzero(
+                (depths >= (-np.inf if mindepth is None else mindepth)) &
+                (depths <= (np.inf if maxdepth is None else maxdepth)))
+
+        self.dataset = ds[keep].isel({k: v for k, v in selection.items() if k in ds[keep].dims})
+        self.start = datetime.fromtimestamp(start_s, tz=timezone.utc) if start_s is not None else None
+        self.end = datetime.fromtimestamp(end_s, tz=timezone.utc) if end_s is not None else None
+
+    def close(self):
+        for o in self.opened:
+            o.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def load(self) -> Dict:
+        """Read the whole window"""
+        data = {}
+        for name in self.keep:
+            values = self.dataset[name].values
+            data[name] = {
+                "dims": list(self.dataset[name].dims),
+                "values": to_epoch(values) if name == self.time else values
+            }
+        return data
+
+    def mask(self, periods: Dict[str, List[Tuple[float, float]]]):
+        """
+        Set variables to NaN during flagged periods, given as variable to list of
+        (start, end) epoch seconds. Masking stays lazy and applies before downsampling,
+        together with the min and max companions of pyramid levels.
+        """
+        times = to_epoch(self.dataset[self.time].values)
+        for name, spans in periods.items():
+            if name not in self.dataset or self.time_dim not in self.dataset[name].dims:
+                continue
+            flagged = np.zeros(len(times), dtype=bool)
+            for start, end in spans:
+                flagged |= (times >= start) & (times <= end)
+            if not flagged.any():
+                continue
+            valid = xr.DataArray(~flagged, dims=self.time_dim)
+            for variable in (name,) + self.extremes.get(name, ()):
+                self.dataset[variable] = self.dataset[variable].where(valid)
+
+    def downsample(self, points: int, method: str = "mean", anchor: float = 0.0):
+        """
+        Reduce the window to about points timesteps.
+
+        mean and minmax aggregate equal width time bins aligned to anchor (minmax keeps the
+        minimum and maximum of each bin), lttb keeps the most visually significant timesteps
+        of the first variable. The reduced window replaces the lazily selected one.
+        """
+        size = self.dataset.sizes.get(self.time_dim, 0)
+        if size == 0 or (size <= points and not (method == "minmax" and self.extremes)):
+            return
+        times = to_epoch(self.dataset[self.time].values)
+        variables = [v for v in self.keep if v not in (self.time, self.depth)]
+        if method == "lttb":
+            if len(variables) == 0 or self.dataset[variables[0]].dims != (self.time_dim,):
+                raise ValueError("lttb downsampling requires a time series parameter")
+            index = lttb(times, self.dataset[variables[0]].values, points)
+            self.dataset = self.dataset.isel({self.time_dim: index}).load()
+            return
+
+        bins = points if method == "mean" else max(points // 2, 1)
+        edges = bin_edges(times[0], times[-1], bins, anchor)
+        reduce = mean_bins if method == "mean" else minmax_bins
+        data = {}
+        for name in variables:
+            variable = self.dataset[name]
+            if self.time_dim not in variable.dims:
+                data[name] = variable.load()
+                continue
+            dims = (self.time_dim,) + tuple(d for d in variable.dims if d != self.time_dim)
+            if method == "minmax" and name in self.extremes:
+                minimum, maximum = (self.dataset[e].transpose(*dims).values.astype("float64") for e in self.extremes[name])
+                binned_times, values = minmax_bins(times, minimum, edges, maximum)
+            else:
+                binned_times, values = reduce(times, variable.transpose(*dims).values.astype("float64"), edges)
+            data[name] = (dims, values)
+        binned_times, _ = reduce(times, np.zeros(len(times)), edges)
+        data[self.time] = ((self.time_dim,), binned_times)
+        if self.depth:
+            data[self.depth] = self.dataset[self.depth].load()
+        self.dataset = xr.Dataset(data)[self.keep]
+
+    def blocks(self, size: int) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Read the window in blocks of size timesteps as flat table columns.
+
+        Datasets with a depth axis are returned in long format with one row per time and depth.
+        """
+        steps = self.dataset.sizes.get(self.time_dim, 0)
+        for i in range(0, steps, size):
+            yield self.table(self.dataset.isel({self.time_dim: slice(i, i + size)}))
+
+    def table(self, block: xr.Dataset) -> Dict[str, np.ndarray]:
+        """Flatten a block of the window to table columns"""
+        t = to_epoch(block[self.time].values)
+        if self.depth:
+            d = block[self.depth].values.astype("float64")
+            columns = {self.time: np.repeat(t, len(d)), self.depth: np.tile(d, len(t))}
+        else:
+            d = np.empty(1)
+            columns = {self.time: t}
+        for name in self.keep:
+            if name in columns:
+                continue
+            variable = block[name]
+            if set(variable.dims) - {self.time_dim, self.depth_dim}:
+                raise ValueError(f"Variable {name} with dimensions {variable.dims} cannot be returned as a table")
+            if self.time_dim in variable.dims and self.depth_dim in variable.dims:
+                columns[name] = variable.transpose(self.time_dim, self.depth_dim).values.ravel()
+            elif self.time_dim in variable.dims:
+                columns[name] = np.repeat(variable.values, len(d))
+            elif self.depth_dim in variable.dims:
+                columns[name] = np.tile(variable.values, len(t))
+            else:
+                columns[name] = np.full(len(t) * len(d), variable.values)
+        return columns
+
+
+def to_json_list(values: np.ndarray):
+    """
+    Prepare an array for JSON encoding with NaN written as null.
+
+    float32/64 arrays are returned as contiguous arrays which orjson serializes natively,
+    anything else as a list.
+    """
+    if values.dtype in (np.float32, np.float64) and values.ndim > 0:
+        return np.ascontiguousarray(values)
+    if np.issubdtype(values.dtype, np.floating):
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
@@ -0,0 +1,181 @@
+from typing import Collection, Dict, List, Optional
+from pathlib import Path
+import numpy as np
+import xarray as xr
+import asyncio
+import logging
+import shutil
+import json
+import os
+
+from app.netcdf import Source, Window, dataset_files, repository_datasets, to_epoch, DEFAULT_WINDOW_DAYS
+from app.virtualzarr import index_sources
+from app.formats import BLOCK_SIZE
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+LEVELS = sorted(int(level) for level in os.getenv("PYRAMID_LEVELS", "3600,86400,604800").split(","))
+PYRAMID_FOLDER = ".pyramids"
+MANIFEST = "index.json"
+
+
+def pyramid_path(repositories_id: int, datasets_id: int, root: Optional[Path] = None) -> Path:
+    """Folder holding the aggregation levels of a dataset"""
+    return Path(root or f"{FILESYSTEM}/git/{repositories_id}") / PYRAMID_FOLDER / str(datasets_id)
+
+
+def pyramid_variables(folder: Path) -> Optional[List[str]]:
+    """Variables of the pyramid in folder, None when there is none"""
+    try:
+        with open(folder / MANIFEST) as f:
+            return json.load(f)["variables"]
+    except FileNotFoundError:
+        return None
+
+
+def merge(ids: np.ndarray, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    Combine partial aggregates that share a bin id, ids must be sorted.
+
+    Columns are reduced according to their suffix, `:min` and `:max` with a NaN ignoring
+    minimum and maximum and everything else (`:sum`, `:count`) with a sum.
+    """
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    merged = {"id": ids[starts]}
+    for key, values in columns.items():
+        op = np.fmin if key.endswith(":min") else np.fmax if key.endswith(":max") else np.add
+        merged[key] = op.reduceat(values, starts, axis=0)
+    return merged
+
+
+def build_dataset_pyramid(sources: List[Source], variables: List[str], time: str, depth: Optional[str], folder: Path) -> Dict:
+    """
+    Write hourly, daily and weekly (PYRAMID_LEVELS seconds) aggregations of a dataset.
+
+    The record is read once in blocks and reduced to the finest level, coarser levels are
+    aggregated from the finer one. Each level stores the mean, `{variable}_min` and
+    `{variable}_max` of every time dependent variable. Levels that are not coarser than
+    the native resolution of the data are skipped.
+    """
+    tmp = folder.with_name(f"{folder.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    with Window(sources, variables, time, depth, window_days=None) as window:
+        ds = window.dataset
+        times = to_epoch(ds[time].values)
+        resolution = float(np.median(np.diff(times))) if len(times) > 1 else np.inf
+        levels = [level for level in LEVELS if level > resolution]
+        series = [v for v in variables if window.time_dim in ds[v].dims]
+        dims = {v: (window.time_dim,) + tuple(d for d in ds[v].dims if d != window.time_dim) for v in series}
+
+        partials = []
+        for i in range(0, len(times) if levels else 0, BLOCK_SIZE):
+            block = ds.isel({window.time_dim: slice(i, i + BLOCK_SIZE)})
+            t = times[i:i + BLOCK_SIZE]
+            columns = {"time:sum": t, "time:count": np.ones(len(t))}
+            for v in series:
+                values = block[v].transpose(*dims[v]).values.astype("float64")
+                valid = ~np.isnan(values)
+                columns[f"{v}:sum"] = np.where(valid, values, 0.0)
+                columns[f"{v}:count"] = valid.astype("float64")
+                columns[f"{v}:min"] = values
+                columns[f"{v}:max"] = values
+            partials.append(merge(np.floor(t / levels[0]).astype("int64"), columns))
+
+        static = {name: ds[name].load() for name in ds.data_vars if name not in series and name != time}
+        if depth:
+            static[depth] = ds[depth].load()
+
+    written = []
+    if partials:
+        level = merge(
+            np.concatenate([p["id"] for p in partials]),
+            {key: np.concatenate([p[key] for p in partials]) for key in partials[0] if key != "id"}
+        )
+        current = levels[0]
+        for width in levels:
+            if width != current:
+                level = merge(level["id"] * current // width, {k: v for k, v in level.items() if k != "id"})
+                current = width
+            data = {time: ((window.time_dim,), level["time:sum"] / level["time:count"],
+                           {"units": "seconds since 1970-01-01 00:00:00"})}
+            with np.errstate(invalid="ignore", divide="ignore"):
+                for v in series:
+                    data[v] = (dims[v], level[f"{v}:sum"] / level[f"{v}:count"])
+                    data[f"{v}_min"] = (dims[v], level[f"{v}:min"])
+                    data[f"{v}_max"] = (dims[v], level[f"{v}:max"])
+            xr.Dataset({**data, **static}).to_netcdf(tmp / f"{width}.nc")
+            written.append(width)
+
+    manifest = {
+        "variables": window.keep,
+        "levels": written,
+        "start": float(times[0]) if len(times) else None,
+        "end": float(times[-1]) if len(times) else None
+    }
+    with open(tmp / MANIFEST, "w") as f:
+        json.dump(manifest, f)
+
+    old = folder.with_name(f"{folder.name}.old")
+    if folder.exists():
+        folder.rename(old)
+    tmp.rename(folder)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def pyramid_source(repositories_id: int, datasets_id: int, keep: List[str], points: int,
+                   start: Optional[float] = None, end: Optional[float] = None) -> Optional[Source]:
+    """
+    Return the coarsest aggregation level that still has at least points bins in [start, end].
+
+    Returns None when the dataset has no pyramid or the raw data should be used.
+    """
+    folder = pyramid_path(repositories_id, datasets_id)
+    try:
+        with open(folder / MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not set(keep).issubset(manifest["variables"]) or not manifest["levels"]:
+        return None
+    if end is None:
+        end = manifest["end"]
+    if start is None:
+        start = end - DEFAULT_WINDOW_DAYS * 86400
+    levels = [level for level in manifest["levels"] if level <= (end - start) / points]
+    if not levels:
+        return None
+    return Source(folder / f"{max(levels)}.nc")
+
+
+async def build_repository_pyramids(session, repositories_id: int, root: Optional[Path] = None, reuse: Collection[int] = ()):
+    """
+    Build the aggregation levels of every dataset in a repository, or of a release at root.
+
+    Datasets in reuse keep the pyramid already in place when it has the current variables.
+    """
+    datasets = await repository_datasets(session, repositories_id)
+    # Release the connection, none is held while building
+    await session.commit()
+    for dataset, time, depth, variables in datasets:
+        try:
+            keep = list(dict.fromkeys([time] + ([depth] if depth else []) + variables))
+            if dataset.id in reuse and pyramid_variables(pyramid_path(repositories_id, dataset.id, root=root)) == keep:
+                logging.info(f"Reused pyramid for dataset {dataset.id}")
+                continue
+            sources = index_sources(repositories_id, dataset.id, [time] + ([depth] if depth else []) + variables,
+                                    start=-np.inf, end=np.inf, root=root)
+            if sources is None:
+                sources = [Source(f) for f in dataset_files(repositories_id, dataset.datasourcelink, dataset.fileconnect, root=root)]
+            if len(sources) == 0:
+                continue
+            await asyncio.to_thread(
+                build_dataset_pyramid, sources, variables, time, depth, pyramid_path(repositories_id, dataset.id, root=root)
+            )
+            logging.info(f"Built pyramid for dataset {dataset.id}")
+        except Exception as e:
+            logging.error(f"Error building pyramid for dataset {dataset.id}: {e}")
@@ -0,0 +1,161 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import select
+from typing import List, Literal, Optional
+from urllib.parse import urlencode
+from datetime import datetime
+import numpy as np
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+from app.database import SessionDep, check_order
+from app.cache import cache, json_bytes, validators
+from app.staging import release_id
+from app.models import Datasets, Datasetparameters, Maintenance
+from app.routes.maintenance import overlapping
+from app.netcdf import Source, Window, dataset_files, parameter_axes, to_json_list
+from app.virtualzarr import index_sources
+from app.fileindex import window_files
+from app.pyramids import pyramid_source
+from app.formats import MEDIA_TYPES, STREAMS
+
+load_dotenv()
+
+DATA_CACHE_MAX_BYTES = int(os.getenv("DATA_CACHE_MAX_BYTES", "1000000"))
+
+router = APIRouter(
+    prefix="/data",
+    tags=["Data"]
+)
+
+
+@router.get("/{datasets_id}")
+async def get_data(
+        datasets_id: int,
+        request: Request,
+        session: SessionDep,
+        parameters: Optional[List[str]] = Query(None, description="Parameters (parseparameter) to return, defaults to all"),
+        start: Optional[datetime] = Query(None, description="Start of the time window"),
+        end: Optional[datetime] = Query(None, description="End of the time window"),
+        mindepth: Optional[float] = Query(None, description="Minimum depth"),
+        maxdepth: Optional[float] = Query(None, description="Maximum depth"),
+        max_points: Optional[int] = Query(None, ge=3, description="Downsample the time axis to about this many timesteps"),
+        method: Literal["mean", "minmax", "lttb"] = Query("mean", description="Downsampling method"),
+        mask: bool = Query(True, description="Set values inside maintenance windows to null"),
+        format: Literal["json", "csv", "arrow", "parquet"] = Query("json", description="Output format, csv, arrow and parquet are streamed")):
+    """Get data for a dataset"""
+    check_order(start, end, "start must be before end")
+    dataset = await session.get(Datasets, datasets_id)
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
+    if not dataset.datasourcelink or dataset.repositories_id is None:
+        raise HTTPException(status_code=404, detail="Dataset has no data source")
+
+    key = None
+    if format == "json":
+        headers = await validators("datasets", "datasetparameters", "maintenance")
+        query = urlencode(sorted(request.query_params.multi_items()))
+        key = f"data/{datasets_id}/{release_id(dataset.repositories_id)}:{headers['ETag']}?{query}"
+        body = await cache.get(key)
+        if body is not None:
+            return Response(content=body, media_type="application/json")
+
+    result = await session.exec(
+        select(Datasetparameters).where(Datasetparameters.datasets_id == datasets_id)
+    )
+    datasetparameters = {p.parseparameter: p for p in result.all()}
+    time, depth, variables = parameter_axes(list(datasetparameters.values()))
+    if time is None:
+        raise HTTPException(status_code=404, detail="Dataset has no time parameter")
+
+    if parameters:
+        unknown = [p for p in parameters if p not in variables]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown parameters: {', '.join(unknown)}")
+        variables = parameters
+
+    keep = [time] + ([depth] if depth else []) + variables
+    start_s, end_s = start.timestamp() if start else None, end.timestamp() if end else None
+    sources = None
+    level = None
+    flagged = False
+    if mask and max_points and method != "lttb":
+        # Pyramid levels aggregate unmasked data, only use them when no maintenance window can fall in the request
+        result = await session.exec(
+            select(Maintenance.id)
+            .where(*overlapping(datasets_id, start=start, end=end),
+                   Maintenance.datasetparameters_id.in_([datasetparameters[name].id for name in keep]))
+            .limit(1)
+        )
+        flagged = result.first() is not None
+    if max_points and method != "lttb" and not flagged:
+        level = pyramid_source(dataset.repositories_id, datasets_id, keep, max_points, start_s, end_s)
+        sources = [level] if level else None
+    if sources is None:
+        sources = index_sources(dataset.repositories_id, datasets_id, keep, start_s, end_s)
+    if sources is None:
+        files = await window_files(session, dataset.repositories_id, datasets_id, start, end)
+        if files is None:
+            files = dataset_files(dataset.repositories_id, dataset.datasourcelink, dataset.fileconnect)
+        sources = [Source(f) for f in files]
+    if len(sources) == 0:
+        raise HTTPException(status_code=404, detail="Data files not found")
+
+    try:
+        window = await asyncio.to_thread(
+            Window, sources, variables, time, depth, start, end, mindepth, maxdepth,
+            extremes=level is not None and method == "minmax"
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+    if mask:
+        result = await session.exec(
+            select(Maintenance.datasetparameters_id, Maintenance.starttime, Maintenance.endtime)
+            .where(*overlapping(datasets_id, start=window.start, end=window.end))
+        )
+        names = {p.id: name for name, p in datasetparameters.items()}
+        periods = {}
+        for datasetparameters_id, starttime, endtime in result.all():
+            if datasetparameters_id in names:
+                periods.setdefault(names[datasetparameters_id], []).append(
+                    (starttime.timestamp() if starttime else -np.inf, endtime.timestamp() if endtime else np.inf))
+        window.mask(periods)
+
+    if max_points:
+        anchor = dataset.mindatetime.timestamp() if dataset.mindatetime else 0.0
+        try:
+            await asyncio.to_thread(window.downsample, max_points, method, anchor)
+        except ValueError as e:
+            window.close()
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if format != "json":
+        return StreamingResponse(
+            STREAMS[format](window),
+            media_type=MEDIA_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="datalakes_{datasets_id}.{format}"'}
+        )
+
+    with window:
+        values = await asyncio.to_thread(window.load)
+
+    body = json_bytes({
+        "datasets_id": datasets_id,
+        "start": window.start,
+        "end": window.end,
+        "variables": {
+            name: {
+                "axis": datasetparameters[name].axis,
+                "unit": datasetparameters[name].unit,
+                "parameters_id": datasetparameters[name].parameters_id,
+                "dims": variable["dims"],
+                "data": to_json_list(variable["values"])
+            } for name, variable in values.items()
+        }
+    })
+    if len(body) <= DATA_CACHE_MAX_BYTES:
+        await cache.set(key, body)
+    return Response(content=body, media_type="application/json")
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlmodel import select, delete
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from sqlmodel import select, insert, update, delete, Text
+from typing import List, Optional
 
-from app.database import SessionDep
+from app.database import SessionDep, json_rows, projection
+from app.cache import cached_response, invalidate
 from app.models import Datasetparameters, DatasetparametersBase
 from app.auth import check_member, check_dataset_permissions
 
@@ -11,25 +13,56 @@ router = APIRouter(
 )
 
 
+MAX_PAGE_SIZE = 5000
+
+
+def datasetparameters_query(
+        columns: Optional[List[str]] = None,
+        datasets_id: Optional[List[int]] = None,
+        parameters_id: Optional[List[int]] = None,
+        after: Optional[int] = None,
+        limit: Optional[int] = None):
+    """Dataset parameters matching the filters as one JSON array"""
+    where = []
+    if datasets_id:
+        where.append(Datasetparameters.datasets_id.in_(datasets_id))
+    if parameters_id:
+        where.append(Datasetparameters.parameters_id.in_(parameters_id))
+    return select(json_rows(Datasetparameters, *where, columns=columns, after=after, limit=limit).cast(Text))
+
+
 @router.get("/")
-async def get_all_datasetparameters(session: SessionDep):
+async def get_all_datasetparameters(
+        request: Request,
+        session: SessionDep,
+        fields: Optional[List[str]] = Query(None, description="Columns to return (id is always included)"),
+        datasets_id: Optional[List[int]] = Query(None, description="Only parameters of these datasets"),
+        parameters_id: Optional[List[int]] = Query(None, description="Only these parameters"),
+        after: Optional[int] = Query(None, description="Page cursor, only dataset parameters with a larger id"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, the Link header points to the next page")):
     """Get all dataset parameters"""
-    result = await session.exec(select(Datasetparameters))
-    return result.all()
+    columns = projection(Datasetparameters, fields)
+
+    async def load():
+        result = await session.exec(datasetparameters_query(columns, datasets_id, parameters_id, after, limit))
+        return result.one().encode()
+    return await cached_response(request, "datasetparameters", ["datasetparameters"], load, limit=limit)
 
 
 @router.get("/{datasets_id}")
-async def get_dataset_datasetparameters(datasets_id: int, session: SessionDep):
+async def get_dataset_datasetparameters(datasets_id: int, request: Request, session: SessionDep):
     """Get specific dataset"""
-    result = await session.exec(
-        select(Datasetparameters).where(Datasetparameters.datasets_id == datasets_id)
-    )
-    dataset = result.all()
+    async def load():
+        result = await session.exec(
+            select(Datasetparameters).where(Datasetparameters.datasets_id == datasets_id)
+        )
+        dataset = result.all()
 
-    if len(dataset) == 0:
-        raise HTTPException(status_code=404, detail="Dataset not found")
+        if len(dataset) == 0:
+            raise HTTPException(status_code=404, detail="Dataset not found")
 
-    return dataset
+        return dataset
+    return await cached_response(request, f"datasetparameters/{datasets_id}", ["datasetparameters"], load)
 
 
 @router.post("/", status_code=201)
@@ -42,10 +75,65 @@ async def create_datasetparameter(
     dataset = Datasetparameters.model_validate(dataset_in)
     session.add(dataset)
     await session.commit()
+    await invalidate("datasetparameters")
     await session.refresh(dataset)
     return dataset
 
 
+@router.put("/{datasets_id}", status_code=200)
+async def replace_dataset_datasetparameters(
+        datasets_id: int,
+        parameters_in: List[DatasetparametersBase],
+        session: SessionDep,
+        _: dict = Depends(check_dataset_permissions)
+):
+    """
+    Replace all dataset parameters of a dataset in one transaction.
+
+    Rows are matched to the existing parameters by axis, matching parameters are updated
+    in place and keep their id (maintenance entries refer to it), new axes are inserted
+    and all other parameters are deleted.
+    """
+    if any(p.datasets_id != datasets_id for p in parameters_in):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"All dataset parameters must belong to dataset with id {datasets_id}"
+        )
+    axes = [p.axis for p in parameters_in]
+    if len(set(axes)) != len(axes):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Axes must be unique within a dataset")
+
+    result = await session.exec(
+        select(Datasetparameters.axis, Datasetparameters.id)
+        .where(Datasetparameters.datasets_id == datasets_id)
+        .order_by(Datasetparameters.id)
+        .with_for_update()
+    )
+    # axis is not unique in the table, the oldest row of an axis is kept and the others deleted
+    existing = {}
+    for axis, datasetparameters_id in result.all():
+        existing.setdefault(axis, datasetparameters_id)
+    updates = [{"id": existing[p.axis], **p.model_dump()} for p in parameters_in if p.axis in existing]
+    inserts = [p.model_dump() for p in parameters_in if p.axis not in existing]
+
+    await session.exec(
+        delete(Datasetparameters)
+        .where(Datasetparameters.datasets_id == datasets_id)
+        .where(Datasetparameters.id.not_in([u["id"] for u in updates]))
+    )
+    if updates:
+        await session.exec(update(Datasetparameters), params=updates)
+    if inserts:
+        await session.exec(insert(Datasetparameters), params=inserts)
+    await session.commit()
+    await invalidate("datasetparameters")
+
+    result = await session.exec(
+        select(Datasetparameters).where(Datasetparameters.datasets_id == datasets_id).order_by(Datasetparameters.id)
+    )
+    return result.all()
+
+
 @router.put("/{datasets_id}/{datasetparameters_id}", status_code=200)
 async def overwrite_datasetparameter(
         datasets_id: int,
@@ -73,6 +161,7 @@ async def overwrite_datasetparameter(
         setattr(existing, key, value)
 
     await session.commit()
+    await invalidate("datasetparameters")
     await session.refresh(existing)
     return existing
 
@@ -88,6 +177,7 @@ async def delete_dataset_dataparameters(
         delete(Datasetparameters).where(Datasetparameters.datasets_id == datasets_id)
     )
     await session.commit()
+    await invalidate("datasetparameters")
     return None
 
 @router.delete("/{datasets_id}/{datasetparameters_id}", status_code=204)
@@ -110,4 +200,5 @@ async def delete_dataparameter(
 
     await session.delete(dataset)
     await session.commit()
+    await invalidate("datasetparameters")
     return None
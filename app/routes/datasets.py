@@ -1,8 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlmodel import select
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from sqlmodel import select, func, cast, literal, literal_column, Float, Numeric, Text
+from typing import List, Optional
+from datetime import datetime
 
-from app.database import SessionDep
-from app.models import Datasets, DatasetsCreate, DatasetsUpdate
+from app.database import SessionDep, json_rows, projection, ordered_range, check_order
+from app.cache import cached_response, invalidate
+from app.models import Datasets, DatasetsCreate, DatasetsUpdate, Datasetparameters
 from app.auth import check_member, check_dataset_permissions
 
 router = APIRouter(
@@ -10,24 +13,122 @@ router = APIRouter(
     tags=["Datasets"]
 )
 
+MAX_PAGE_SIZE = 1000
+SEARCH_FIELDS = ["id", "title", "lakes_id", "latitude", "longitude", "mindatetime", "maxdatetime", "mindepth", "maxdepth"]
+
+# Same expressions as the GiST indexes of migration 0002, the planner only uses an
+# expression index when the query repeats it exactly. Missing bounds are unbounded.
+LOCATION = func.point(Datasets.longitude, Datasets.latitude)
+TIME_RANGE = ordered_range(func.tstzrange, Datasets.mindatetime, Datasets.maxdatetime)
+DEPTH_RANGE = ordered_range(func.numrange, Datasets.mindepth, Datasets.maxdepth)
+
+def parse_bbox(bbox: Optional[str]) -> Optional[List[float]]:
+    """Bounding box query parameter minlon,minlat,maxlon,maxlat as four floats"""
+    if not bbox:
+        return None
+    try:
+        box = [float(v) for v in bbox.split(",")]
+    except ValueError:
+        box = None
+    if box is None or len(box) != 4:
+        raise HTTPException(status_code=400, detail="bbox must be minlon,minlat,maxlon,maxlat")
+    return box
+
+def datasets_query(
+        columns: Optional[List[str]] = None,
+        lakes_id: Optional[List[int]] = None,
+        parameters_id: Optional[List[int]] = None,
+        bbox: Optional[List[float]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        after: Optional[int] = None,
+        limit: Optional[int] = None,
+        mindepth: Optional[float] = None,
+        maxdepth: Optional[float] = None):
+    """Published datasets matching the filters as one JSON array"""
+    where = [Datasets.title.is_not(None), Datasets.dataportal.is_not(None)]
+    if lakes_id:
+        where.append(Datasets.lakes_id.in_(lakes_id))
+    if parameters_id:
+        where.append(
+            select(Datasetparameters.id).where(
+                Datasetparameters.datasets_id == Datasets.id,
+                Datasetparameters.parameters_id.in_(parameters_id)
+            ).exists()
+        )
+    if bbox:
+        corners = [func.point(cast(literal(x), Float), cast(literal(y), Float)) for x, y in (bbox[:2], bbox[2:])]
+        where.append(LOCATION.op("<@")(func.box(*corners)))
+    if start or end:
+        where.append(TIME_RANGE.op("&&")(func.tstzrange(start, end, literal_column("'[]'"))))
+    if mindepth is not None or maxdepth is not None:
+        window = func.numrange(cast(literal(mindepth), Numeric), cast(literal(maxdepth), Numeric), literal_column("'[]'"))
+        where.append(DEPTH_RANGE.op("&&")(window))
+    return select(json_rows(Datasets, *where, columns=columns, after=after, limit=limit).cast(Text))
+
 @router.get("/")
-async def get_all_datasets(session: SessionDep):
+async def get_all_datasets(
+        request: Request,
+        session: SessionDep,
+        fields: Optional[List[str]] = Query(None, description="Columns to return, e.g. id,title,latitude,longitude (id is always included)"),
+        lakes_id: Optional[List[int]] = Query(None, description="Only datasets of these lakes"),
+        parameters_id: Optional[List[int]] = Query(None, description="Only datasets measuring one of these parameters"),
+        bbox: Optional[str] = Query(None, description="Only datasets inside the bounding box minlon,minlat,maxlon,maxlat"),
+        start: Optional[datetime] = Query(None, description="Only datasets with data after this time"),
+        end: Optional[datetime] = Query(None, description="Only datasets with data before this time"),
+        after: Optional[int] = Query(None, description="Page cursor, only datasets with a larger id"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, the Link header points to the next page")):
     """Get all datasets"""
-    result = await session.exec(
-        select(Datasets).where(
-            Datasets.title.is_not(None),
-            Datasets.dataportal.is_not(None)
-        )
-    )
-    return result.all()
+    columns = projection(Datasets, fields)
+    box = parse_bbox(bbox)
+    check_order(start, end, "start must be before end")
+
+    async def load():
+        result = await session.exec(datasets_query(columns, lakes_id, parameters_id, box, start, end, after, limit))
+        return result.one().encode()
+    return await cached_response(request, "datasets", ["datasets", "datasetparameters"] if parameters_id else ["datasets"],
+                                 load, limit=limit)
+
+@router.get("/search")
+async def search_datasets(
+        request: Request,
+        session: SessionDep,
+        bbox: Optional[str] = Query(None, description="Datasets located inside the bounding box minlon,minlat,maxlon,maxlat"),
+        start: Optional[datetime] = Query(None, description="Datasets with data after this time"),
+        end: Optional[datetime] = Query(None, description="Datasets with data before this time"),
+        mindepth: Optional[float] = Query(None, description="Datasets with data below this depth"),
+        maxdepth: Optional[float] = Query(None, description="Datasets with data above this depth"),
+        parameters_id: Optional[List[int]] = Query(None, description="Datasets measuring one of these parameters"),
+        fields: Optional[List[str]] = Query(None, description=f"Columns to return, default {','.join(SEARCH_FIELDS)}"),
+        after: Optional[int] = Query(None, description="Page cursor, only datasets with a larger id"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, the Link header points to the next page")):
+    """
+    Find datasets by location, time window, depth range and parameters.
+
+    Time and depth match when the dataset range overlaps the requested one. Every filter
+    is answered from an index so discovery stays fast as the catalog grows.
+    """
+    columns = projection(Datasets, fields or SEARCH_FIELDS)
+    box = parse_bbox(bbox)
+    check_order(start, end, "start must be before end")
+    check_order(mindepth, maxdepth, "mindepth must not be greater than maxdepth")
+
+    async def load():
+        query = datasets_query(columns, None, parameters_id, box, start, end, after, limit, mindepth, maxdepth)
+        result = await session.exec(query)
+        return result.one().encode()
+    return await cached_response(request, "datasets/search", ["datasets", "datasetparameters"] if parameters_id else ["datasets"],
+                                 load, limit=limit)
 
 @router.get("/{datasets_id}")
-async def get_dataset(datasets_id: int, session: SessionDep):
+async def get_dataset(datasets_id: int, request: Request, session: SessionDep):
     """Get specific dataset"""
-    existing = await session.get(Datasets, datasets_id)
-    if not existing:
-        raise HTTPException(status_code=404, detail="Dataset not found")
-    return existing
+    async def load():
+        existing = await session.get(Datasets, datasets_id)
+        if not existing:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        return existing
+    return await cached_response(request, f"datasets/{datasets_id}", ["datasets"], load)
 
 @router.post("/", status_code=201)
 async def create_dataset(
@@ -47,6 +148,7 @@ async def create_dataset(
     dataset = Datasets.model_validate(dataset_in)
     session.add(dataset)
     await session.commit()
+    await invalidate("datasets")
     await session.refresh(dataset)
     return dataset
 
@@ -73,6 +175,7 @@ async def update_dataset(
 
     session.add(existing)
     await session.commit()
+    await invalidate("datasets")
     await session.refresh(existing)
     return existing
 
@@ -90,4 +193,5 @@ async def delete_dataset(datasets_id: int, session: SessionDep, _: dict = Depend
 
     await session.delete(dataset)
     await session.commit()
+    await invalidate("datasets")
     return None
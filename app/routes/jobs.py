@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlmodel import select, Text
+from typing import List, Optional
+
+from app.database import SessionDep, json_rows, projection
+from app.cache import page_links
+from app.models import Jobs
+from app.auth import check_member
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"]
+)
+
+MAX_PAGE_SIZE = 1000
+
+@router.get("/")
+async def get_all_jobs(
+        request: Request,
+        session: SessionDep,
+        fields: Optional[List[str]] = Query(None, description="Columns to return (id is always included)"),
+        repositories_id: Optional[int] = Query(None, description="Only jobs of this repository"),
+        status: Optional[List[str]] = Query(None, description="Only jobs with one of these statuses (queued, running, success, failed)"),
+        after: Optional[int] = Query(None, description="Page cursor, only jobs with a larger id"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, the Link header points to the next page"),
+        _: dict = Depends(check_member)):
+    """Get background jobs, errors hold git output so only team members can read them"""
+    where = []
+    if repositories_id is not None:
+        where.append(Jobs.repositories_id == repositories_id)
+    if status:
+        where.append(Jobs.status.in_(status))
+    result = await session.exec(select(
+        json_rows(Jobs, *where, columns=projection(Jobs, fields), after=after, limit=limit).cast(Text)
+    ))
+    body = result.one().encode()
+    return Response(content=body, media_type="application/json", headers=page_links(request, body, limit))
+
+@router.get("/{jobs_id}")
+async def get_job(jobs_id: int, session: SessionDep, _: dict = Depends(check_member)):
+    """Get the status of a background job"""
+    job = await session.get(Jobs, jobs_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,14 +1,55 @@
-from fastapi import APIRouter, HTTPException, status
-from sqlmodel import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlmodel import select, insert, func, literal_column, Text
+from typing import List, Optional
+from datetime import datetime
 
-from app.database import SessionDep
-from app.models import MaintenanceCreate, MaintenanceUpdate, Maintenance
+from app.database import SessionDep, json_rows, ordered_range, check_order
+from app.cache import cached_response, invalidate
+from app.auth import check_member
+from app.models import MaintenanceCreate, MaintenanceUpdate, Maintenance, check_period
 
 router = APIRouter(
     prefix="/maintenance",
     tags=["Maintenance"]
 )
 
+# Same expression as the GiST index of migration 0003, missing start or end times are unbounded
+TIME_RANGE = ordered_range(func.tstzrange, Maintenance.starttime, Maintenance.endtime)
+
+
+def overlapping(
+        datasets_id: Optional[int] = None,
+        parameters_id: Optional[List[int]] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None) -> list:
+    """Filters selecting the maintenance windows that overlap [start, end]"""
+    where = []
+    if datasets_id is not None:
+        where.append(Maintenance.datasets_id == datasets_id)
+    if parameters_id:
+        where.append(Maintenance.parameters_id.in_(parameters_id))
+    if start or end:
+        where.append(TIME_RANGE.op("&&")(func.tstzrange(start, end, literal_column("'[]'"))))
+    return where
+
+
+@router.get("/")
+async def get_overlapping_maintenance(
+        request: Request,
+        session: SessionDep,
+        datasets_id: Optional[int] = Query(None, description="Only maintenance of this dataset"),
+        parameters_id: Optional[List[int]] = Query(None, description="Only maintenance of these parameters"),
+        start: Optional[datetime] = Query(None, description="Only maintenance ending after this time"),
+        end: Optional[datetime] = Query(None, description="Only maintenance starting before this time")):
+    """Get the maintenance windows overlapping a time range"""
+    check_order(start, end, "start must be before end")
+    async def load():
+        result = await session.exec(select(
+            json_rows(Maintenance, *overlapping(datasets_id, parameters_id, start, end)).cast(Text)))
+        return result.one().encode()
+    return await cached_response(request, "maintenance", ["maintenance"], load)
+
+
 @router.get("/{maintenance_id}")
 async def get_maintenance(maintenance_id: int, session: SessionDep):
     """Get maintenance"""
@@ -28,21 +69,44 @@ async def get_dataset_maintenance(datasets_id: int, session: SessionDep):
 @router.post("/", status_code=201)
 async def create_maintenance(
         maintenance_in: MaintenanceCreate,
-        session: SessionDep
+        session: SessionDep,
+        _: dict = Depends(check_member)
 ):
     """Create a new maintenance"""
     maintenance = Maintenance.model_validate(maintenance_in)
     session.add(maintenance)
     await session.commit()
+    await invalidate("maintenance")
     await session.refresh(maintenance)
     return maintenance
 
 
+@router.post("/bulk", status_code=201)
+async def create_maintenance_bulk(
+        maintenance_in: List[MaintenanceCreate],
+        session: SessionDep,
+        _: dict = Depends(check_member)
+):
+    """Create many maintenance windows in one transaction"""
+    if not maintenance_in:
+        return []
+    result = await session.exec(
+        insert(Maintenance).returning(Maintenance),
+        params=[Maintenance.model_validate(m).model_dump(exclude={"id"}) for m in maintenance_in]
+    )
+    # Read before the commit expires the returned rows
+    maintenance = [m.model_dump() for m in result.scalars().all()]
+    await session.commit()
+    await invalidate("maintenance")
+    return maintenance
+
+
 @router.patch("/{maintenance_id}", status_code=200)
 async def update_maintenance(
         maintenance_id: int,
         maintenance_in: MaintenanceUpdate,
-        session: SessionDep
+        session: SessionDep,
+        _: dict = Depends(check_member)
 ):
     """Update an existing maintenance"""
     existing = await session.get(Maintenance, maintenance_id)
@@ -52,20 +116,27 @@ async def update_maintenance(
             detail=f"Maintenance with id {maintenance_id} not found"
         )
     maintenance_data = maintenance_in.model_dump(exclude_unset=True)
+    try:
+        check_period(maintenance_data.get("starttime", existing.starttime), maintenance_data.get("endtime", existing.endtime))
+    except ValueError as e:
+        # Same status as the model validation of a request inverted on its own
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
     for key, value in maintenance_data.items():
         setattr(existing, key, value)
     session.add(existing)
     await session.commit()
+    await invalidate("maintenance")
     await session.refresh(existing)
     return existing
 
 
 @router.delete("/{maintenance_id}", status_code=204)
-async def delete_maintenance(maintenance_id: int, session: SessionDep):
+async def delete_maintenance(maintenance_id: int, session: SessionDep, _: dict = Depends(check_member)):
     """Delete a maintenance"""
     existing = await session.get(Maintenance, maintenance_id)
     if not existing:
         raise HTTPException(status_code=404, detail="Maintenance not found")
     await session.delete(existing)
     await session.commit()
+    await invalidate("maintenance")
     return None
@@ -1,49 +1,80 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
-from sqlmodel import select
-from pathlib import Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlmodel import select, delete, case, func, Text
+from typing import List, Optional
 import logging
-import asyncio
-import shutil
+import orjson
 import os
 
-from app.database import SessionDep
-from app.models import Repositories, RepositoriesBase
-from app.auth import check_member, check_maintainer
-from app.functions import extract_ssh_parts
-from app.database import async_session_maker
-
 from dotenv import load_dotenv
 
-load_dotenv()
-
-FILESYSTEM = os.getenv("FILESYSTEM")
+from app.database import SessionDep, json_rows, projection
+from app.cache import page_links
+from app.models import Repositories, RepositoriesBase, Datasets, Jobs
+from app.auth import check_member, check_maintainer, check_webhook
+from app.functions import extract_ssh_parts
+from app.database import async_session_maker
+from app.staging import staging_path, migrate_legacy, publish_repository, remove_repository
+from app.jobs import enqueue, handler
+from app.git import clone_repository, pull_repository, source_pattern, sparse_paths
 
 router = APIRouter(
     prefix="/repositories",
     tags=["Repositories"]
 )
 
+load_dotenv()
+
+MAX_PAGE_SIZE = 1000
+WEBHOOK_DEBOUNCE = float(os.getenv("WEBHOOK_DEBOUNCE", "60"))
+
+def repository_status():
+    """
+    Status of a repository from its latest sync job: updating while queued or running, then success or failed.
+
+    Repositories without sync jobs keep the status stored before jobs existed.
+    """
+    latest = (
+        select(case((Jobs.status.in_(("queued", "running")), "updating"), else_=Jobs.status))
+        .where(Jobs.repositories_id == Repositories.id, Jobs.kind == "sync")
+        .order_by(Jobs.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    return func.coalesce(latest, Repositories.status)
+
 @router.get("/")
-async def get_all_repositories(session: SessionDep):
+async def get_all_repositories(
+        request: Request,
+        session: SessionDep,
+        fields: Optional[List[str]] = Query(None, description="Columns to return (id is always included)"),
+        status: Optional[List[str]] = Query(None, description="Only repositories with one of these statuses"),
+        after: Optional[int] = Query(None, description="Page cursor, only repositories with a larger id"),
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size, the Link header points to the next page")):
     """Get all repositories"""
-    results = await session.exec(select(Repositories))
-    return results.all()
+    derived = repository_status()
+    where = [derived.in_(status)] if status else []
+    result = await session.exec(select(
+        json_rows(Repositories, *where, columns=projection(Repositories, fields), after=after, limit=limit,
+                  computed={"status": derived}).cast(Text)
+    ))
+    body = result.one().encode()
+    return Response(content=body, media_type="application/json", headers=page_links(request, body, limit))
 
 @router.get("/{repositories_id}")
 async def get_repository(repositories_id: int, session: SessionDep):
     """Get specific repository"""
     result = await session.exec(
-        select(Repositories).where(Repositories.id == repositories_id)
+        select(Repositories, repository_status()).where(Repositories.id == repositories_id)
     )
-    dataset = result.first()
-    if not dataset:
+    row = result.first()
+    if not row:
         raise HTTPException(status_code=404, detail="Repository not found")
-    return dataset
+    repository, status = row
+    return {**repository.model_dump(), "status": status}
 
 @router.post("/", status_code=202)
 async def add_repository(
         repository_in: RepositoriesBase,
-        background_tasks: BackgroundTasks,
         session: SessionDep,
         _: dict = Depends(check_member)):
     """Create a new repository"""
@@ -51,99 +82,129 @@ async def add_repository(
     existing_repo = result.one_or_none()
     if existing_repo:
         logging.info(f"Repository {repository_in.ssh} already in database")
-        existing_repo.status = "updating"
         repo_id = existing_repo.id
-        await session.commit()
     else:
         repository = Repositories.model_validate(repository_in)
-        repository.status = "updating"
         session.add(repository)
         await session.commit()
         await session.refresh(repository)
         repo_id = repository.id
 
     ssh = extract_ssh_parts(repository_in.ssh)
-    repo_path = Path(f'{FILESYSTEM}/git/{repo_id}/{ssh["name"]}')
-    if repo_path.exists():
-        logging.info(f"Pulling repository {os.path.basename(repo_path)}")
-        background_tasks.add_task(pull_repository, str(repo_path), repo_id)
-        return {"id": repo_id, "status": "pull"}
+    migrate_legacy(repo_id)
+    job = await enqueue("sync", repo_id)
+    if (staging_path(repo_id) / ssh["name"]).exists():
+        logging.info(f"Queued pull of repository {repository_in.ssh}")
+        return {"id": repo_id, "job": job.id, "status": "pull"}
     else:
-        logging.info(f"Cloning repository {repository_in.ssh}")
-        background_tasks.add_task(clone_repository, repository_in.ssh, str(repo_path), repo_id)
-        return {"id": repo_id, "status": "clone"}
+        logging.info(f"Queued clone of repository {repository_in.ssh}")
+        return {"id": repo_id, "job": job.id, "status": "clone"}
+
+@router.post("/webhook", status_code=202)
+async def repository_webhook(request: Request, session: SessionDep, body: bytes = Depends(check_webhook)):
+    """
+    Queue a sync of the repository a GitHub or GitLab push event was sent for.
+
+    The sync runs WEBHOOK_DEBOUNCE seconds after the first push, later pushes within that
+    window are coalesced into the same queued pull. Pushes to other branches than the one
+    registered (the default branch when none) are ignored.
+    """
+    event = request.headers.get("x-github-event") or request.headers.get("x-gitlab-event")
+    if event not in ("push", "Push Hook"):
+        return {"status": "ignored", "jobs": []}
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid webhook payload")
+    github, gitlab = payload.get("repository") or {}, payload.get("project") or {}
+    ssh = github.get("ssh_url") or gitlab.get("git_ssh_url")
+    default_branch = github.get("default_branch") or gitlab.get("default_branch")
+    if not ssh:
+        raise HTTPException(status_code=400, detail="Webhook payload has no repository ssh url")
+    branch = payload.get("ref", "").removeprefix("refs/heads/")
+
+    result = await session.exec(select(Repositories).where(Repositories.ssh == ssh))
+    repositories = result.all()
+    if not repositories:
+        raise HTTPException(status_code=404, detail=f"Repository {ssh} is not registered")
+    jobs = []
+    for repository in repositories:
+        if branch != (repository.branch or default_branch):
+            continue
+        job = await enqueue("sync", repository.id, delay=WEBHOOK_DEBOUNCE)
+        jobs.append(job.id)
+    logging.info(f"Push to {ssh} {branch} queued jobs {jobs}")
+    return {"status": "queued" if jobs else "ignored", "jobs": jobs}
 
 @router.delete("/{repositories_id}", status_code=204)
 async def delete_repository(repositories_id: int, session: SessionDep, _: dict = Depends(check_maintainer)):
     """Delete a repository"""
-    result = await session.exec(
-        select(Repositories).where(Repositories.id == repositories_id)
-    )
-    repository = result.first()
+    repository = await session.get(Repositories, repositories_id)
 
     if not repository:
         raise HTTPException(status_code=404, detail="Repository not found")
 
     logging.info(f"Deleting repository {repository.id}")
-    ssh = extract_ssh_parts(repository.ssh)
-    repo_path = Path(f'{FILESYSTEM}/git/{repository.id}/{ssh["name"]}')
-    try:
-        shutil.rmtree(repo_path)
-    except Exception as e:
-        logging.error(f"Error deleting directory {repo_path}: {e}")
+    await session.exec(delete(Jobs).where(Jobs.repositories_id == repository.id, Jobs.status == "queued"))
     await session.delete(repository)
     await session.commit()
+    # A sync publishing meanwhile removes its release itself once it sees the row is gone
+    try:
+        remove_repository(repositories_id)
+    except Exception as e:
+        logging.error(f"Error deleting directories of repository {repositories_id}: {e}")
     return None
 
 
-async def pull_repository(repo_path: str, repo_id: int):
-    """Pull repository"""
-    async with async_session_maker() as session:
-        result = await session.execute(select(Repositories).where(Repositories.id == repo_id))
-        repo = result.scalar_one()
-        try:
-            proc = await asyncio.create_subprocess_exec(
-                'git', '-C', repo_path, 'pull',
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
-            if proc.returncode != 0:
-                raise RuntimeError(f"Git pull failed: {stderr.decode()}")
-            repo.status = "success"
-            logging.info(f"Pulling successful")
-        except Exception as e:
-            logging.error(f"Error pulling repository {repo_id}: {e}")
-            repo.status = "failed"
-        finally:
-            await session.commit()
-
+@handler("sync")
+async def sync_repository(job: Jobs):
+    """
+    Clone or pull a repository and publish a release.
 
-async def clone_repository(ssh: str, repo_path: str, repo_id: int):
-    """Clone repository"""
+    No connection is held while git runs and no lock while publishing, a repository deleted
+    meanwhile is noticed afterwards and its directories removed.
+    """
     async with async_session_maker() as session:
-        result = await session.execute(select(Repositories).where(Repositories.id == repo_id))
-        repo = result.scalar_one()
-        try:
-            proc = await asyncio.create_subprocess_exec(
-                'git', 'clone', ssh, repo_path,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await proc.communicate()
-            if proc.returncode != 0:
-                raise RuntimeError(f"Git clone failed: {stderr.decode()}")
-            repo.status = "success"
-            logging.info(f"Cloning successful")
-        except Exception as e:
-            logging.error(f"Error cloning repository {ssh}: {e}")
-            repo.status = "failed"
-            repo_path_obj = Path(repo_path)
-            if repo_path_obj.exists():
-                try:
-                    shutil.rmtree(repo_path_obj)
-                    logging.info(f"Cleaned up failed clone at {repo_path}")
-                except Exception as cleanup_error:
-                    logging.error(f"Failed to cleanup directory {repo_path}: {cleanup_error}")
-        finally:
+        repo = await session.get(Repositories, job.repositories_id)
+        if repo is None:
+            logging.info(f"Repository {job.repositories_id} was deleted, nothing to sync")
+            return
+        result = await session.execute(
+            select(Datasets.id, Datasets.datasourcelink, Datasets.fileconnect).where(Datasets.repositories_id == repo.id)
+        )
+        sources = {datasets_id: (link, fileconnect) for datasets_id, link, fileconnect in result.all()}
+    name = extract_ssh_parts(repo.ssh)["name"]
+    repo_path = staging_path(repo.id) / name
+    paths = sparse_paths(name, sources.values())
+    try:
+        if repo_path.exists():
+            changes = await pull_repository(str(repo_path), repo.branch, paths)
+        else:
+            changes = await clone_repository(repo.ssh, str(repo_path), repo.branch, paths)
+        async with async_session_maker() as session:
+            if not await repository_exists(session, repo.id):
+                logging.info(f"Repository {repo.id} was deleted during the sync, nothing to publish")
+                remove_repository(repo.id)
+                return
             await session.commit()
+            unchanged = [d for d, source in sources.items() if not changes.touches(source_pattern(name, *source))]
+            changed = None if changes.files is None else [f"{name}/{file}" for file in changes.files]
+            await publish_repository(session, repo.id, unchanged=unchanged, changed=changed)
+    except Exception:
+        async with async_session_maker() as session:
+            if await repository_exists(session, repo.id):
+                raise
+        logging.info(f"Repository {repo.id} was deleted during the sync, removing what is left of it")
+        remove_repository(repo.id)
+        return
+    async with async_session_maker() as session:
+        if not await repository_exists(session, repo.id):
+            logging.info(f"Repository {repo.id} was deleted while publishing, removing its release")
+            remove_repository(repo.id)
+
+async def repository_exists(session, repositories_id: int) -> bool:
+    """Whether the repository row is still there, the key share lock keeps it until the transaction ends"""
+    result = await session.execute(
+        select(Repositories.id).where(Repositories.id == repositories_id).with_for_update(key_share=True)
+    )
+    return result.first() is not None
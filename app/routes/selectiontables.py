@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Path, HTTPException, status, Depends
-from sqlmodel import select
+from fastapi import APIRouter, Path, HTTPException, Request, status, Depends
+from sqlmodel import select, func, literal_column, Text
 from typing import Literal, Dict, Any
 from pydantic import ValidationError
 
-from app.database import SessionDep
+from app.database import SessionDep, json_rows
+from app.cache import cached_response, invalidate
 from app import models
 from app.auth import check_member
 
@@ -24,25 +25,36 @@ TABLE_MODELS = {
 
 TableName = Literal[tuple(TABLE_MODELS.keys())]
 
+AXIS = '[{"name": "M"}, {"name": "x"}, {"name": "y"}, {"name": "z"}]'
+
+# All selection tables as one JSON document built by Postgres in a single round trip
+CATALOG_QUERY = select(
+    func.json_build_object(
+        *[arg for name, model in TABLE_MODELS.items() for arg in (literal_column(f"'{name}'"), json_rows(model))],
+        literal_column("'axis'"), literal_column(f"'{AXIS}'::json")
+    ).cast(Text)
+)
+
 @router.get("/")
-async def get_all_selection_tables(session: SessionDep):
+async def get_all_selection_tables(request: Request, session: SessionDep):
     """Get all selection tables data"""
-    response = {}
-    for table_name, model in TABLE_MODELS.items():
-        result = await session.exec(select(model))
-        response[table_name] = result.all()
-    response["axis"] = [{"name": "M"}, {"name": "x"}, {"name": "y"}, {"name": "z"}]
-    return response
+    async def load():
+        result = await session.exec(CATALOG_QUERY)
+        return result.one().encode()
+    return await cached_response(request, "selectiontables", ["selectiontables"], load)
 
 
 @router.get("/{table}")
 async def get_selection_table(
+        request: Request,
         session: SessionDep,
         table: TableName = Path(..., description="Table name")):
     """Get all rows from the specified table"""
-    model = TABLE_MODELS[table]
-    results = await session.exec(select(model))
-    return results.all()
+    async def load():
+        model = TABLE_MODELS[table]
+        results = await session.exec(select(model))
+        return results.all()
+    return await cached_response(request, f"selectiontables/{table}", ["selectiontables"], load)
 
 
 @router.post("/{table}", status_code=status.HTTP_201_CREATED)
@@ -64,6 +76,7 @@ async def create_section_table_row(
 
     session.add(new_row)
     await session.commit()
+    await invalidate("selectiontables")
     await session.refresh(new_row)
 
     return new_row
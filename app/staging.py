@@ -0,0 +1,149 @@
+from datetime import datetime
+from pathlib import Path
+from typing import Collection, Optional
+import asyncio
+import logging
+import shutil
+import os
+
+from app.virtualzarr import build_repository_index, index_path, relocate_index
+from app.pyramids import build_repository_pyramids, pyramid_path
+from app.fileindex import index_repository_files
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+RELEASES_KEEP = int(os.getenv("RELEASES_KEEP", "2"))
+
+
+def live_path(repositories_id: int) -> Path:
+    """Folder served to readers, a symlink to the current release"""
+    return Path(f"{FILESYSTEM}/git/{repositories_id}")
+
+
+def release_id(repositories_id: int) -> str:
+    """Identifier of the content served from the live folder, changes whenever it is republished"""
+    live = live_path(repositories_id).resolve()
+    try:
+        return f"{live.name}.{live.stat().st_mtime_ns}"
+    except FileNotFoundError:
+        return ""
+
+
+def staging_path(repositories_id: int) -> Path:
+    """Folder holding the git working tree that clones and pulls write to"""
+    return Path(f"{FILESYSTEM}/staging/{repositories_id}")
+
+
+def releases_path(repositories_id: int) -> Path:
+    """Folder holding the published snapshots of a repository"""
+    return Path(f"{FILESYSTEM}/releases/{repositories_id}")
+
+
+def link_or_copy(src: str, dst: str):
+    """Hardlink a file, falling back to a copy on filesystems without hardlinks"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def migrate_legacy(repositories_id: int):
+    """Move a repository cloned directly into the live folder to the staging folder"""
+    live = live_path(repositories_id)
+    if live.is_dir() and not live.is_symlink():
+        staging = staging_path(repositories_id)
+        staging.parent.mkdir(parents=True, exist_ok=True)
+        shutil.rmtree(staging, ignore_errors=True)
+        live.rename(staging)
+        shutil.rmtree(staging / ".virtualzarr", ignore_errors=True)
+        logging.info(f"Moved repository {repositories_id} to staging")
+
+
+def create_release(repositories_id: int) -> Path:
+    """
+    Snapshot the staging working tree into a new release folder.
+
+    Files are hardlinked so a release costs no extra disk space. Git replaces files rather
+    than writing them in place, so later pulls into staging never modify a release.
+    """
+    release = releases_path(repositories_id) / datetime.now().strftime("%Y%m%d%H%M%S%f")
+    shutil.copytree(
+        staging_path(repositories_id),
+        release,
+        ignore=shutil.ignore_patterns(".git"),
+        copy_function=link_or_copy
+    )
+    return release
+
+
+def carry_over(repositories_id: int, previous: Path, release: Path, datasets_ids: Collection[int]):
+    """Copy the indexes and pyramids of datasets whose files did not change from the previous release"""
+    for datasets_id in datasets_ids:
+        index = index_path(repositories_id, datasets_id, root=previous)
+        if index.is_dir():
+            target = index_path(repositories_id, datasets_id, root=release)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            relocate_index(index, target, previous, release)
+        pyramid = pyramid_path(repositories_id, datasets_id, root=previous)
+        if pyramid.is_dir():
+            shutil.copytree(pyramid, pyramid_path(repositories_id, datasets_id, root=release), copy_function=link_or_copy)
+
+
+def promote_release(repositories_id: int, release: Path):
+    """
+    Atomically point the live folder at a release and prune old releases.
+
+    The previous releases are kept (RELEASES_KEEP) so readers holding open files or
+    index references from before the swap can finish their reads.
+    """
+    live = live_path(repositories_id)
+    live.parent.mkdir(parents=True, exist_ok=True)
+    tmp = live.with_name(f".{live.name}.tmp")
+    if tmp.is_symlink():
+        tmp.unlink()
+    tmp.symlink_to(release.resolve(), target_is_directory=True)
+    os.replace(tmp, live)
+
+    releases = sorted(p for p in releases_path(repositories_id).iterdir() if p.is_dir())
+    for old in releases[:-RELEASES_KEEP]:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def remove_repository(repositories_id: int):
+    """Remove the live link, staging working tree and releases of a repository"""
+    live = live_path(repositories_id)
+    if live.is_symlink():
+        live.unlink()
+    elif live.exists():
+        shutil.rmtree(live)
+    shutil.rmtree(staging_path(repositories_id), ignore_errors=True)
+    shutil.rmtree(releases_path(repositories_id), ignore_errors=True)
+
+
+async def publish_repository(session, repositories_id: int, unchanged: Collection[int] = (),
+                             changed: Optional[Collection[str]] = None):
+    """
+    Create a release from staging, build its indexes and pyramids, promote it and update
+    the files table.
+
+    The indexes and pyramids of the unchanged datasets are carried over from the live
+    release instead of being rebuilt, so a pull only reprocesses the datasets it touched.
+    Likewise only the changed files (relative to the repository folder, None for all) are
+    read again for the files table.
+    """
+    release = await asyncio.to_thread(create_release, repositories_id)
+    live = live_path(repositories_id)
+    try:
+        if unchanged and live.is_symlink():
+            await asyncio.to_thread(carry_over, repositories_id, live.resolve(), release, unchanged)
+        await build_repository_index(session, repositories_id, root=release, reuse=unchanged)
+        await build_repository_pyramids(session, repositories_id, root=release, reuse=unchanged)
+        await asyncio.to_thread(promote_release, repositories_id, release)
+    except Exception:
+        shutil.rmtree(release, ignore_errors=True)
+        raise
+    logging.info(f"Published release {release.name} of repository {repositories_id}")
+    await index_repository_files(session, repositories_id, root=release, changed=changed)
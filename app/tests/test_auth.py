@@ -0,0 +1,102 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import app.auth as auth
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_resolve_user(monkeypatch):
+    calls = []
+
+    async def github(request: httpx.Request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.01)
+        if request.url.path == "/user":
+            return httpx.Response(200, json={"login": "datalakes-test"})
+        return httpx.Response(200, json={"role": "maintainer"})
+
+    monkeypatch.setattr(auth, "client", httpx.AsyncClient(transport=httpx.MockTransport(github)))
+
+    results = await asyncio.gather(*[auth.check_maintainer(token="test-token-1") for _ in range(5)])
+    assert all(user["login"] == "datalakes-test" for user in results)
+    assert len(calls) == 2
+
+    assert (await auth.check_member(token="test-token-1"))["login"] == "datalakes-test"
+    assert len(calls) == 2
+
+    await auth.check_member(token="test-token-2")
+    assert len(calls) == 4
+
+
+@pytest.mark.anyio
+async def test_resolve_user_role_failure(monkeypatch):
+    failing = [True]
+
+    async def github(request: httpx.Request):
+        if request.url.path == "/user":
+            return httpx.Response(200, json={"login": "datalakes-test"})
+        if failing[0]:
+            raise httpx.ConnectError("GitHub unavailable")
+        return httpx.Response(200, json={"role": "maintainer"})
+
+    monkeypatch.setattr(auth, "client", httpx.AsyncClient(transport=httpx.MockTransport(github)))
+
+    with pytest.raises(HTTPException) as e:
+        await auth.check_maintainer(token="test-token-role-failure")
+    assert e.value.status_code == 403
+
+    failing[0] = False
+    assert (await auth.check_maintainer(token="test-token-role-failure"))["login"] == "datalakes-test"
+
+
+@pytest.mark.anyio
+async def test_session_tokens(monkeypatch):
+    calls = []
+    role = ["member"]
+
+    async def github(request: httpx.Request):
+        calls.append(request.url.path)
+        if request.url.path == "/user":
+            return httpx.Response(200, json={"login": "datalakes-session", "id": 7, "name": "Test"})
+        return httpx.Response(200, json={"role": role[0]})
+
+    monkeypatch.setattr(auth, "client", httpx.AsyncClient(transport=httpx.MockTransport(github)))
+    monkeypatch.setattr(auth, "JWT_SECRET", "test-secret")
+
+    session = await auth.create_session("test-token-3")
+    assert session["token_type"] == "bearer"
+    assert len(calls) == 2
+
+    user = await auth.check_member(token=session["access_token"])
+    assert user == {"login": "datalakes-session", "id": 7, "name": "Test"}
+    with pytest.raises(HTTPException) as e:
+        await auth.check_maintainer(token=session["access_token"])
+    assert e.value.status_code == 403
+    with pytest.raises(HTTPException) as e:
+        await auth.check_member(token=session["refresh_token"])
+    assert e.value.status_code == 401
+    assert len(calls) == 2
+
+    refreshed = await auth.refresh_session(session["refresh_token"])
+    assert (await auth.check_member(token=refreshed["access_token"]))["login"] == "datalakes-session"
+    assert len(calls) == 4
+
+    # The refresh asks GitHub again rather than the cache, a role change applies straight away
+    role[0] = "maintainer"
+    refreshed = await auth.refresh_session(session["refresh_token"])
+    assert (await auth.check_maintainer(token=refreshed["access_token"]))["login"] == "datalakes-session"
+    assert (await auth.resolve_user("test-token-3"))[1] == "maintainer"
+    assert len(calls) == 6
+
+    monkeypatch.setattr(auth, "JWT_ACCESS_TTL", -1)
+    expired = (await auth.create_session("test-token-3"))["access_token"]
+    with pytest.raises(HTTPException) as e:
+        await auth.check_member(token=expired)
+    assert e.value.status_code == 401
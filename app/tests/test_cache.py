@@ -0,0 +1,71 @@
+import fakeredis.aioredis
+import asyncio
+import pytest
+
+from app.cache import LocalCache, RedisCache
+
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.mark.anyio
+async def test_local_cache():
+    cache = LocalCache(maxsize=2, ttl=60)
+    await cache.set("datasets", b"[1]")
+    await cache.set("selectiontables", b"{}")
+    assert await cache.get("datasets") == b"[1]"
+
+    await cache.set("datasetparameters", b"[2]")
+    assert await cache.get("selectiontables") is None  # Least recently used is evicted
+    assert await cache.get("datasets") == b"[1]"
+
+    await cache.set("datasets", b"[3]", ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await cache.get("datasets") is None
+
+    assert await cache.get_versions(["datasets"]) == [(0, 0.0)]
+    await cache.bump(["datasets"])
+    assert (await cache.get_versions(["datasets"]))[0][0] == 1
+
+
+@pytest.mark.anyio
+async def test_redis_cache():
+    server = fakeredis.FakeServer()
+    worker_1 = RedisCache(client=fakeredis.aioredis.FakeRedis(server=server), ttl=60)
+    worker_2 = RedisCache(client=fakeredis.aioredis.FakeRedis(server=server), ttl=60)
+
+    await worker_1.set("datasets", b"[1]")
+    assert await worker_2.get("datasets") == b"[1]"
+
+    await worker_1.bump(["datasets", "datasetparameters"])
+    versions = await worker_2.get_versions(["datasets", "datasetparameters", "selectiontables"])
+    assert [v for v, _ in versions] == [1, 1, 0]
+    assert versions[0][1] > 0
+
+    await worker_2.set("data", b"[]", ttl=0.01)
+    await asyncio.sleep(0.02)
+    assert await worker_1.get("data") is None
+
+    await worker_1.clear()
+    assert await worker_2.get("datasets") is None
+    await worker_1.close()
+    await worker_2.close()
+
+
+@pytest.mark.anyio
+async def test_redis_cache_unavailable():
+    server = fakeredis.FakeServer()
+    cache = RedisCache(client=fakeredis.aioredis.FakeRedis(server=server), ttl=60)
+    await cache.bump(["datasets"])
+    server.connected = False
+
+    assert await cache.get("datasets") is None
+    await cache.set("datasets", b"[1]")
+    await cache.bump(["datasets"])
+    assert await cache.get_versions(["datasets", "maintenance"]) == [(0, 0.0), (0, 0.0)]
+
+    server.connected = True
+    assert [v for v, _ in await cache.get_versions(["datasets"])] == [1]
+    await cache.close()
@@ -0,0 +1,294 @@
+from httpx import ASGITransport, AsyncClient
+from dotenv import load_dotenv
+from pathlib import Path
+import pyarrow.parquet as pq
+import pyarrow as pa
+import pandas as pd
+import numpy as np
+import io
+import xarray as xr
+import pytest
+import shutil
+import os
+
+from app.auth import check_member, check_dataset_permissions
+from app.database import async_session_maker, engine
+from app.virtualzarr import build_repository_index, index_path, MANIFEST
+from app.pyramids import build_repository_pyramids, pyramid_path
+from app.fileindex import index_repository_files, window_files
+from app.models import Files
+from sqlmodel import select, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+from datetime import datetime, timezone
+from app.main import app
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+
+def override_check_member():
+    return {"user_id": 1, "role": "member"}  # Mock user data
+
+app.dependency_overrides[check_member] = override_check_member
+app.dependency_overrides[check_dataset_permissions] = override_check_member
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+def repository():
+    repositories_id = 0
+    folder = Path(f"{FILESYSTEM}/git/{repositories_id}/datalakes-test/data/Level2")
+    folder.mkdir(parents=True, exist_ok=True)
+    depth = np.array([1.0, 5.0, 10.0])
+    for month in ["2025-01", "2025-02"]:
+        time = pd.date_range(f"{month}-01", periods=24 * 7, freq="1h")
+        ds = xr.Dataset(
+            {
+                "temp": (("time", "depth"), np.random.rand(len(time), len(depth))),
+                "wind": (("time",), np.random.rand(len(time))),
+            },
+            coords={"time": time, "depth": depth}
+        )
+        ds.to_netcdf(folder / f"L2_Test_{month.replace('-', '')}01_000000.nc")
+    yield repositories_id
+    shutil.rmtree(Path(f"{FILESYSTEM}/git/{repositories_id}"))
+
+@pytest.mark.anyio
+async def test_data(repository):
+    dataset = {
+        "title": "Example Data",
+        "datasourcelink": "datalakes-test/data/Level2/L2_Test_20250101_000000.nc",
+        "fileconnect": "time",
+        "repositories_id": repository,
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post("/datasets/", json=dataset)
+        assert response.status_code == 201
+        datasets_id = response.json()["id"]
+
+        parameters = [
+            {"parameters_id": 1, "axis": "x", "parseparameter": "time", "unit": "seconds since 1970-01-01 00:00:00"},
+            {"parameters_id": 2, "axis": "y", "parseparameter": "depth", "unit": "m"},
+            {"parameters_id": 5, "axis": "z", "parseparameter": "temp", "unit": "degC"},
+            {"parameters_id": 7, "axis": "z1", "parseparameter": "wind", "unit": "m/s"},
+        ]
+        ids = {}
+        for parameter in parameters:
+            response = await ac.post("/datasetparameters/", json={"datasets_id": datasets_id, **parameter})
+            assert response.status_code == 201
+            ids[parameter["parseparameter"]] = response.json()["id"]
+
+        response = await ac.get(f"/data/{datasets_id}", params={
+            "parameters": "temp",
+            "start": "2025-01-02T00:00:00Z",
+            "end": "2025-02-02T23:59:59Z",
+            "maxdepth": 5
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data["variables"]) == {"time", "depth", "temp"}
+        time = data["variables"]["time"]["data"]
+        assert len(time) == 24 * 6 + 24 * 2
+        assert time == sorted(time)
+        assert data["variables"]["depth"]["data"] == [1.0, 5.0]
+        assert np.array(data["variables"]["temp"]["data"]).shape == (len(time), 2)
+
+        response = await ac.get(f"/data/{datasets_id}")
+        assert response.status_code == 200
+        assert set(response.json()["variables"]) == {"time", "depth", "temp", "wind"}
+
+        async with async_session_maker() as session:
+            await build_repository_index(session, repository)
+        assert (index_path(repository, datasets_id) / MANIFEST).exists()
+
+        response = await ac.get(f"/data/{datasets_id}", params={
+            "start": "2025-01-02T00:00:00Z",
+            "end": "2025-02-02T23:59:59Z"
+        })
+        assert response.status_code == 200
+        indexed = response.json()["variables"]
+        assert indexed["time"]["data"] == time
+        assert len(indexed["wind"]["data"]) == len(time)
+
+        window = {"start": "2025-01-02T00:00:00Z", "end": "2025-02-02T23:59:59Z", "parameters": ["temp", "wind"]}
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "format": "csv"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        table = pd.read_csv(io.StringIO(response.text))
+        assert list(table.columns) == ["time", "depth", "temp", "wind"]
+        assert len(table) == len(time) * 3
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "format": "arrow"})
+        assert response.status_code == 200
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table.num_rows == len(time) * 3
+        assert table.column("time").to_pylist()[::3] == time
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "format": "parquet"})
+        assert response.status_code == 200
+        table = pq.read_table(io.BytesIO(response.content))
+        assert table.column_names == ["time", "depth", "temp", "wind"]
+        assert table.num_rows == len(time) * 3
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "max_points": 10})
+        assert response.status_code == 200
+        downsampled = response.json()["variables"]
+        assert len(downsampled["time"]["data"]) <= 11
+        assert np.array(downsampled["temp"]["data"]).shape == (len(downsampled["time"]["data"]), 3)
+        assert np.nanmean(np.array(downsampled["wind"]["data"], dtype=float)) == pytest.approx(
+            np.mean(indexed["wind"]["data"]), abs=0.1)
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "max_points": 10, "method": "minmax"})
+        assert response.status_code == 200
+        downsampled = response.json()["variables"]
+        assert max(downsampled["wind"]["data"]) == max(indexed["wind"]["data"])
+
+        async with async_session_maker() as session:
+            await build_repository_pyramids(session, repository)
+        assert (pyramid_path(repository, datasets_id) / "86400.nc").exists()
+        assert not (pyramid_path(repository, datasets_id) / "3600.nc").exists()
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "max_points": 10})
+        assert response.status_code == 200
+        pyramid = response.json()["variables"]
+        assert len(pyramid["time"]["data"]) == 8
+        assert np.nanmean(np.array(pyramid["wind"]["data"], dtype=float)) == pytest.approx(
+            np.mean(indexed["wind"]["data"]), abs=0.1)
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "max_points": 10, "method": "minmax"})
+        assert response.status_code == 200
+        pyramid = response.json()["variables"]
+        assert max(pyramid["wind"]["data"]) == max(indexed["wind"]["data"])
+        assert min(pyramid["wind"]["data"]) == min(indexed["wind"]["data"])
+        response = await ac.get(f"/data/{datasets_id}", params={
+            "start": "2024-01-10T00:00:00Z", "end": "2024-06-05T00:00:00Z", "max_points": 10, "method": "minmax"})
+        assert response.status_code == 200
+        assert response.json()["variables"]["time"]["data"] == []
+
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "max_points": 10, "method": "lttb"})
+        assert response.status_code == 400
+        response = await ac.get(f"/data/{datasets_id}", params={"parameters": "wind", "max_points": 10, "method": "lttb"})
+        assert response.status_code == 200
+        assert len(response.json()["variables"]["time"]["data"]) == 10
+
+        response = await ac.post("/maintenance/bulk", json=[
+            {"datasets_id": datasets_id, "parameters_id": 7, "datasetparameters_id": ids["wind"],
+             "starttime": "2025-01-03T00:00:00Z", "endtime": "2025-01-03T23:59:59Z"},
+            {"datasets_id": datasets_id, "parameters_id": 5, "datasetparameters_id": ids["temp"],
+             "starttime": "2024-01-01T00:00:00Z", "endtime": "2024-01-02T00:00:00Z"},
+        ])
+        assert response.status_code == 201
+        maintenance = response.json()
+        response = await ac.get("/maintenance/", params={"datasets_id": datasets_id, "start": "2025-01-01T00:00:00Z"})
+        assert response.status_code == 200
+        assert [m["id"] for m in response.json()] == [maintenance[0]["id"]]
+
+        response = await ac.get(f"/data/{datasets_id}", params=window)
+        masked = response.json()["variables"]
+        assert masked["time"]["data"] == time
+        wind = np.array(masked["wind"]["data"], dtype=float)
+        assert np.isnan(wind[24:48]).all() and not np.isnan(np.delete(wind, range(24, 48))).any()
+        assert not np.isnan(np.array(masked["temp"]["data"], dtype=float)).any()
+        response = await ac.get(f"/data/{datasets_id}", params={**window, "mask": False})
+        assert response.json()["variables"]["wind"]["data"] == indexed["wind"]["data"]
+
+        # Pyramid levels hold unmasked aggregates, a flagged peak must not leak into minmax extremes
+        peak = int(np.argmax(np.where(np.arange(len(time)) // 24 == 1, -np.inf, indexed["wind"]["data"])))
+        flagged = datetime.fromtimestamp(time[peak], tz=timezone.utc)
+        response = await ac.post("/maintenance/bulk", json=[
+            {"datasets_id": datasets_id, "parameters_id": 7, "datasetparameters_id": ids["wind"],
+             "starttime": flagged.isoformat(), "endtime": flagged.isoformat()},
+        ])
+        assert response.status_code == 201
+        maintenance += response.json()
+        extremes = {**window, "max_points": 10, "method": "minmax"}
+        response = await ac.get(f"/data/{datasets_id}", params={**extremes, "mask": False})
+        assert max(response.json()["variables"]["wind"]["data"]) == max(indexed["wind"]["data"])
+        response = await ac.get(f"/data/{datasets_id}", params=extremes)
+        assert response.status_code == 200
+        wind = np.array(response.json()["variables"]["wind"]["data"], dtype=float)
+        assert np.nanmax(wind) < indexed["wind"]["data"][peak]
+        assert np.nanmax(wind) == np.max(np.delete(indexed["wind"]["data"], [peak] + list(range(24, 48))))
+        for m in maintenance:
+            response = await ac.delete(f"/maintenance/{m['id']}")
+            assert response.status_code == 204
+
+        response = await ac.get(f"/data/{datasets_id}", params={"parameters": "salinity"})
+        assert response.status_code == 400
+        response = await ac.get(f"/data/{datasets_id}", params={"start": "2025-01-10T00:00:00Z", "end": "2025-01-05T00:00:00Z"})
+        assert response.status_code == 400
+
+        response = await ac.delete(f"/datasetparameters/{datasets_id}")
+        assert response.status_code == 204
+        response = await ac.delete(f"/datasets/{datasets_id}")
+        assert response.status_code == 204
+
+@pytest.mark.anyio
+async def test_file_index(repository):
+    dataset = {
+        "title": "Example Files",
+        "datasourcelink": "datalakes-test/data/Level2/L2_Test_20250101_000000.nc",
+        "fileconnect": "time",
+        "repositories_id": repository,
+    }
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.post("/datasets/", json=dataset)
+        assert response.status_code == 201
+        datasets_id = response.json()["id"]
+        for parameter in [
+            {"parameters_id": 1, "axis": "x", "parseparameter": "time", "unit": "seconds since 1970-01-01 00:00:00"},
+            {"parameters_id": 2, "axis": "y", "parseparameter": "depth", "unit": "m"},
+            {"parameters_id": 7, "axis": "z", "parseparameter": "wind", "unit": "m/s"},
+        ]:
+            response = await ac.post("/datasetparameters/", json={"datasets_id": datasets_id, **parameter})
+            assert response.status_code == 201
+
+        january = "datalakes-test/data/Level2/L2_Test_20250101_000000.nc"
+        february = "datalakes-test/data/Level2/L2_Test_20250201_000000.nc"
+        async with async_session_maker() as session:
+            await index_repository_files(session, repository)
+            await index_repository_files(session, repository)
+            files = (await session.execute(
+                select(Files).where(Files.datasets_id == datasets_id).order_by(Files.filelink))).scalars().all()
+            assert [f.filelink for f in files] == [january, february]
+            assert files[0].mindatetime == datetime(2025, 1, 1, tzinfo=timezone.utc)
+            assert files[0].maxdatetime == datetime(2025, 1, 7, 23, tzinfo=timezone.utc)
+            assert (files[1].mindepth, files[1].maxdepth) == (1.0, 10.0)
+
+        async with AsyncSession(engine) as session:
+            assert await window_files(session, repository, datasets_id + 1) is None
+            root = Path(f"{FILESYSTEM}/git/{repository}").resolve()
+            selected = await window_files(session, repository, datasets_id,
+                                          datetime(2025, 1, 2, tzinfo=timezone.utc), datetime(2025, 1, 3, tzinfo=timezone.utc))
+            assert selected == [root / january]
+            assert await window_files(session, repository, datasets_id) == [root / february]
+            selected = await window_files(session, repository, datasets_id,
+                                          datetime(2025, 1, 7, tzinfo=timezone.utc), datetime(2025, 2, 1, tzinfo=timezone.utc))
+            assert selected == [root / january, root / february]
+            selected = await window_files(session, repository, datasets_id,
+                                          datetime(2026, 1, 1, tzinfo=timezone.utc), datetime(2026, 1, 2, tzinfo=timezone.utc))
+            assert selected == [root / february]
+
+        response = await ac.get(f"/data/{datasets_id}", params={"start": "2025-02-02T00:00:00Z", "end": "2025-02-02T23:59:59Z"})
+        assert response.status_code == 200
+        assert len(response.json()["variables"]["time"]["data"]) == 24
+
+        (root / february).unlink()
+        async with async_session_maker() as session:
+            await index_repository_files(session, repository, changed=[])
+            links = (await session.execute(
+                select(Files.filelink).where(Files.datasets_id == datasets_id))).scalars().all()
+            assert links == [january]
+            await session.execute(delete(Files).where(Files.datasets_id == datasets_id))
+            await session.commit()
+
+        response = await ac.delete(f"/datasetparameters/{datasets_id}")
+        assert response.status_code == 204
+        response = await ac.delete(f"/datasets/{datasets_id}")
+        assert response.status_code == 204
@@ -2,6 +2,8 @@ import pytest
 from httpx import ASGITransport, AsyncClient
 
 from app.auth import check_member, check_dataset_permissions
+from app.database import async_session_maker
+from app.models import Datasetparameters
 from app.main import app
 
 def override_check_member():
@@ -87,3 +89,65 @@ async def test_datasetparameters_lifecycle():
 
         response = await ac.delete(f"/datasetparameters/{datasets_id}")
         assert response.status_code == 204
+
+@pytest.mark.anyio
+async def test_replace_datasetparameters():
+    datasets_id = 0
+    rows = [
+        {"datasets_id": datasets_id, "parameters_id": 1, "axis": "x", "parseparameter": "time"},
+        {"datasets_id": datasets_id, "parameters_id": 5, "axis": "y", "parseparameter": "temperature", "unit": "degC"},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=rows)
+        assert response.status_code == 200
+        created = response.json()
+        assert [(p["axis"], p["parseparameter"]) for p in created] == [("x", "time"), ("y", "temperature")]
+
+        rows[1]["parseparameter"] = "temp"
+        rows = rows[1:] + [{"datasets_id": datasets_id, "parameters_id": 6, "axis": "y1", "parseparameter": "oxygen"}]
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=rows)
+        assert response.status_code == 200
+        replaced = response.json()
+        assert [(p["axis"], p["parseparameter"]) for p in replaced] == [("y", "temp"), ("y1", "oxygen")]
+        assert replaced[0]["id"] == created[1]["id"]
+
+        response = await ac.get(f"/datasetparameters/{datasets_id}")
+        assert response.json() == replaced
+
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=rows + [rows[0]])
+        assert response.status_code == 400
+        response = await ac.put(f"/datasetparameters/{datasets_id + 1}", json=rows)
+        assert response.status_code == 400
+
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=[])
+        assert response.status_code == 200
+        assert response.json() == []
+
+
+@pytest.mark.anyio
+async def test_replace_legacy_datasetparameters():
+    datasets_id = 0
+    # Rows written before the API enforced unique axes, two share an axis and one has none
+    async with async_session_maker() as session:
+        legacy = [
+            Datasetparameters(datasets_id=datasets_id, parameters_id=1, axis="x", parseparameter="time"),
+            Datasetparameters(datasets_id=datasets_id, parameters_id=1, axis="x", parseparameter="time_copy"),
+            Datasetparameters(datasets_id=datasets_id, parameters_id=5, axis=None, parseparameter="temp"),
+        ]
+        session.add_all(legacy)
+        await session.commit()
+        kept = legacy[0].id
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=[
+            {"datasets_id": datasets_id, "parameters_id": 1, "axis": "x", "parseparameter": "time"},
+        ])
+        assert response.status_code == 200
+        assert [(p["id"], p["axis"]) for p in response.json()] == [(kept, "x")]
+
+        response = await ac.put(f"/datasetparameters/{datasets_id}", json=[])
+        assert response.status_code == 200
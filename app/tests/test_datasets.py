@@ -82,7 +82,124 @@ async def test_dataset_lifecycle():
 
         response = await ac.get("/datasets/")
         assert response.status_code == 200
+        etag = response.headers["etag"]
+        assert "last-modified" in response.headers
+
+        response = await ac.get("/datasets/", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = await ac.patch(f"/datasets/{datasets_id}", json={"title": "Updated Dataset"})
+        assert response.status_code == 200
+        response = await ac.get("/datasets/", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
 
         response = await ac.delete(f"/datasets/{datasets_id}")
         assert response.status_code == 204
 
+
+@pytest.mark.anyio
+async def test_dataset_filters():
+    datasets = [
+        {"title": "Filter A", "dataportal": "test", "lakes_id": 1, "latitude": 46.5, "longitude": 6.6,
+         "mindatetime": "2020-01-01T00:00:00Z", "maxdatetime": "2020-12-31T00:00:00Z"},
+        {"title": "Filter B", "dataportal": "test", "lakes_id": 2, "latitude": 47.3, "longitude": 8.6,
+         "mindatetime": "2024-01-01T00:00:00Z", "maxdatetime": "2024-12-31T00:00:00Z"},
+        # Time bounds stored the wrong way round are filtered as if swapped
+        {"title": "Filter C", "dataportal": "test", "lakes_id": 3,
+         "mindatetime": "2010-12-31T00:00:00Z", "maxdatetime": "2010-01-01T00:00:00Z"},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        ids = []
+        for dataset in datasets:
+            response = await ac.post("/datasets/", json=dataset)
+            assert response.status_code == 201
+            ids.append(response.json()["id"])
+        response = await ac.post("/datasetparameters/", json={
+            "datasets_id": ids[1], "parameters_id": 5, "axis": "y", "parseparameter": "temp"})
+        assert response.status_code == 201
+
+        response = await ac.get("/datasets/", params={"fields": "title,latitude", "lakes_id": 1})
+        assert response.status_code == 200
+        rows = [row for row in response.json() if row["id"] in ids]
+        assert rows == [{"id": ids[0], "title": "Filter A", "latitude": 46.5}]
+
+        response = await ac.get("/datasets/", params={"bbox": "8,47,9,48", "fields": "id"})
+        assert ids[1] in [row["id"] for row in response.json()]
+        assert ids[0] not in [row["id"] for row in response.json()]
+
+        response = await ac.get("/datasets/", params={"start": "2023-06-01T00:00:00Z", "end": "2024-06-01T00:00:00Z", "fields": "id"})
+        assert ids[1] in [row["id"] for row in response.json()] and ids[0] not in [row["id"] for row in response.json()]
+        response = await ac.get("/datasets/", params={"start": "2010-06-01T00:00:00Z", "end": "2010-07-01T00:00:00Z", "fields": "id"})
+        assert [row["id"] for row in response.json() if row["id"] in ids] == [ids[2]]
+
+        response = await ac.get("/datasets/", params={"parameters_id": 5, "fields": "id"})
+        assert ids[1] in [row["id"] for row in response.json()] and ids[0] not in [row["id"] for row in response.json()]
+
+        response = await ac.get("/datasets/", params={"fields": "id", "limit": 1, "after": ids[0] - 1})
+        assert response.json() == [{"id": ids[0]}]
+        assert f"after={ids[0]}" in response.headers["link"]
+
+        response = await ac.get("/datasets/", params={"fields": "colour"})
+        assert response.status_code == 400
+        response = await ac.get("/datasets/", params={"bbox": "8,47"})
+        assert response.status_code == 400
+
+        response = await ac.delete(f"/datasetparameters/{ids[1]}")
+        assert response.status_code == 204
+        for datasets_id in ids:
+            response = await ac.delete(f"/datasets/{datasets_id}")
+            assert response.status_code == 204
+
+@pytest.mark.anyio
+async def test_dataset_search():
+    datasets = [
+        {"title": "Search A", "dataportal": "test", "latitude": 46.5, "longitude": 6.6, "mindepth": 0, "maxdepth": 5,
+         "mindatetime": "2020-01-01T00:00:00Z", "maxdatetime": "2020-12-31T00:00:00Z"},
+        {"title": "Search B", "dataportal": "test", "latitude": 47.3, "longitude": 8.6, "mindepth": 20, "maxdepth": 100,
+         "mindatetime": "2024-01-01T00:00:00Z", "maxdatetime": "2024-12-31T00:00:00Z"},
+        # Bounds stored the wrong way round are accepted and searched as if swapped
+        {"title": "Search C", "dataportal": "test", "latitude": 40.0, "longitude": 0.0, "mindepth": 400, "maxdepth": 300,
+         "mindatetime": "2010-12-31T00:00:00Z", "maxdatetime": "2010-01-01T00:00:00Z"},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        ids = []
+        for dataset in datasets:
+            response = await ac.post("/datasets/", json=dataset)
+            assert response.status_code == 201
+            ids.append(response.json()["id"])
+
+        async def search(**params):
+            response = await ac.get("/datasets/search", params=params)
+            assert response.status_code == 200
+            return [row["id"] for row in response.json() if row["id"] in ids]
+
+        assert await search(bbox="6,46,7,47") == [ids[0]]
+        assert await search(start="2024-06-01T00:00:00Z") == [ids[1]]
+        assert await search(end="2020-06-01T00:00:00Z") == [ids[0], ids[2]]
+        assert await search(mindepth=10) == ids[1:]
+        assert await search(mindepth=3, maxdepth=30) == ids[:2]
+        assert await search(mindepth=350, maxdepth=360) == [ids[2]]
+        assert await search(start="2010-06-01T00:00:00Z", end="2010-07-01T00:00:00Z") == [ids[2]]
+        assert await search(bbox="6,46,9,48", start="2020-06-01T00:00:00Z", end="2020-07-01T00:00:00Z", maxdepth=2) == [ids[0]]
+
+        response = await ac.get("/datasets/search", params={"bbox": "6,46,7,47"})
+        row = [row for row in response.json() if row["id"] == ids[0]][0]
+        assert set(row) == {"id", "title", "lakes_id", "latitude", "longitude", "mindatetime", "maxdatetime", "mindepth", "maxdepth"}
+        response = await ac.get("/datasets/search", params={"bbox": "a,b,c,d"})
+        assert response.status_code == 400
+        response = await ac.get("/datasets/search", params={"mindepth": 10, "maxdepth": 1})
+        assert response.status_code == 400
+        response = await ac.get("/datasets/", params={"start": "2025-01-01T00:00:00Z", "end": "2024-01-01T00:00:00Z"})
+        assert response.status_code == 400
+        response = await ac.patch(f"/datasets/{ids[0]}", json={"mindepth": 10})
+        assert response.status_code == 200
+
+        for datasets_id in ids:
+            response = await ac.delete(f"/datasets/{datasets_id}")
+            assert response.status_code == 204
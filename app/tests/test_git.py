@@ -0,0 +1,85 @@
+from pathlib import Path
+import subprocess
+import pytest
+
+from app.git import clone_repository, pull_repository, sparse_paths
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+def run(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+def commit(cwd, files, message):
+    for name, content in files.items():
+        (cwd / name).parent.mkdir(parents=True, exist_ok=True)
+        (cwd / name).write_text(content)
+    run(cwd, "add", ".")
+    run(cwd, "-c", "user.name=test", "-c", "user.email=test@test", "commit", "-q", "-m", message)
+
+@pytest.fixture
+def remote(tmp_path):
+    source = tmp_path / "source"
+    source.mkdir()
+    run(source, "init", "-q", "-b", "main")
+    run(source, "config", "uploadpack.allowfilter", "true")
+    commit(source, {"data/L1/a.nc": "a", "data/L2/b.nc": "b", "docs/readme.md": "docs"}, "first")
+    commit(source, {"data/L1/c.nc": "c"}, "second")
+    run(source, "checkout", "-q", "-b", "dev")
+    commit(source, {"data/L1/d.nc": "d"}, "dev")
+    run(source, "checkout", "-q", "main")
+    return source
+
+def files(path: Path):
+    return sorted(str(p.relative_to(path)) for p in path.rglob("*") if p.is_file() and ".git" not in p.parts)
+
+def test_sparse_paths():
+    assert sparse_paths("repo", [
+        ("repo/data/L1/a.nc", "time"),
+        ("repo/data/L2/b.nc", None),
+        ("repo/data/L3", "time"),
+        ("other/data/x.nc", None),
+        ("repo/../x.nc", None),
+        (None, None),
+    ]) == ["/data/L1/", "/data/L2/b.nc", "/data/L3/"]
+
+@pytest.mark.anyio
+async def test_clone_and_pull(remote, tmp_path):
+    repo = tmp_path / "staging" / "repo"
+    paths = sparse_paths("repo", [("repo/data/L1/a.nc", "time")])
+    changes = await clone_repository(f"file://{remote}", str(repo), paths=paths)
+    assert changes.old is None and changes.files is None and changes.touches("/data/L2/b.nc")
+    assert files(repo) == ["data/L1/a.nc", "data/L1/c.nc"]
+    assert run(repo, "rev-parse", "--is-shallow-repository").strip() == "true"
+    assert run(repo, "rev-list", "--count", "HEAD").strip() == "1"
+
+    changes = await pull_repository(str(repo), paths=paths)
+    assert changes.old == changes.new and changes.files == []
+
+    commit(remote, {"data/L1/e.nc": "e", "docs/more.md": "more"}, "third")
+    changes = await pull_repository(str(repo), paths=paths)
+    assert changes.old != changes.new
+    assert changes.files == ["data/L1/e.nc", "docs/more.md"]
+    assert changes.touches("/data/L1/") and not changes.touches("/data/L2/b.nc") and not changes.touches("/data/")
+
+    changes = await pull_repository(str(repo), paths=paths + ["/data/L2/b.nc"])
+    assert changes.files is None
+    assert files(repo) == ["data/L1/a.nc", "data/L1/c.nc", "data/L1/e.nc", "data/L2/b.nc"]
+
+    await pull_repository(str(repo), "dev", paths)
+    assert "data/L1/d.nc" in files(repo) and "data/L1/e.nc" not in files(repo)
+
+    await pull_repository(str(repo), "main", [])
+    assert "docs/more.md" in files(repo)
+
+@pytest.mark.anyio
+async def test_clone_branch_and_failure(remote, tmp_path):
+    repo = tmp_path / "staging" / "repo"
+    await clone_repository(f"file://{remote}", str(repo), branch="dev")
+    assert "data/L1/d.nc" in files(repo)
+
+    missing = tmp_path / "staging" / "missing"
+    with pytest.raises(RuntimeError):
+        await clone_repository(f"file://{remote}", str(missing), branch="nope")
+    assert not missing.exists()
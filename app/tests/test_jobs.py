@@ -0,0 +1,125 @@
+from httpx import ASGITransport, AsyncClient
+from alembic.config import Config
+from alembic import command
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from sqlmodel import delete, select, func
+import asyncio
+import pytest
+
+from app.database import async_session_maker
+from app.models import Jobs
+from app.auth import check_member
+from app.main import app
+import app.jobs as jobs
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+REPOSITORY = -1
+
+runs = []
+
+def override_check_member():
+    return {"user_id": 1, "role": "member"}  # Mock user data
+
+app.dependency_overrides[check_member] = override_check_member
+
+@jobs.handler("test")
+async def flaky(job):
+    runs.append((job.id, job.attempts))
+    if job.attempts < job.payload.get("failures", 0) + 1:
+        raise RuntimeError("Transient failure")
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def clean(monkeypatch):
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["configure_logger"] = False
+    await asyncio.to_thread(command.upgrade, config, "head")
+    monkeypatch.setattr(jobs, "JOB_RETRY_DELAY", 0.0)
+    jobs.pool.start()
+    yield
+    await jobs.pool.stop()
+    async with async_session_maker() as session:
+        await session.execute(delete(Jobs).where(Jobs.repositories_id.in_([REPOSITORY, REPOSITORY - 1])))
+        await session.commit()
+
+async def wait_for(ac, jobs_id, status):
+    for i in range(50):
+        response = await ac.get(f"/jobs/{jobs_id}")
+        assert response.status_code == 200
+        if response.json()["status"] == status:
+            return response.json()
+        jobs.pool.notify()
+        await asyncio.sleep(0.1)
+    raise AssertionError(f"Job {jobs_id} is {response.json()['status']}, expected {status}")
+
+@pytest.mark.anyio
+async def test_job_retries(clean, monkeypatch):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        first = await jobs.enqueue("test", REPOSITORY, {"failures": 1}, delay=60)
+        second = await jobs.enqueue("test", REPOSITORY, {"failures": 1}, delay=60)
+        assert first.id == second.id and first.status == "queued"
+
+        await jobs.enqueue("test", REPOSITORY)
+        job = await wait_for(ac, first.id, "success")
+        assert job["attempts"] == 2
+        assert [attempt for jobs_id, attempt in runs if jobs_id == first.id] == [1, 2]
+
+        failing = await jobs.enqueue("test", REPOSITORY, {"failures": 10})
+        job = await wait_for(ac, failing.id, "failed")
+        assert job["attempts"] == job["max_attempts"] and job["error"] == "Transient failure"
+
+        response = await ac.get("/jobs/", params={"repositories_id": REPOSITORY, "status": "failed", "fields": "id"})
+        assert response.json() == [{"id": failing.id}]
+        response = await ac.get("/jobs/0")
+        assert response.status_code == 404
+
+        with monkeypatch.context() as m:
+            m.delitem(app.dependency_overrides, check_member)
+            response = await ac.get(f"/jobs/{failing.id}")
+            assert response.status_code == 401
+            response = await ac.get("/jobs/")
+            assert response.status_code == 401
+
+@pytest.mark.anyio
+async def test_job_repository_lock(clean):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        async with async_session_maker() as session:
+            running = Jobs(kind="other", repositories_id=REPOSITORY - 1, status="running",
+                           locked_until=datetime.now(timezone.utc) + timedelta(hours=1))
+            session.add(running)
+            await session.commit()
+            await session.refresh(running)
+
+        queued = await jobs.enqueue("test", REPOSITORY - 1)
+        await asyncio.sleep(0.3)
+        assert (await ac.get(f"/jobs/{queued.id}")).json()["status"] == "queued"
+
+        async with async_session_maker() as session:
+            running.status = "success"
+            session.add(running)
+            await session.commit()
+        await wait_for(ac, queued.id, "success")
+
+@pytest.mark.anyio
+async def test_enqueue_notifies_listener(clean, monkeypatch):
+    woken = asyncio.Event()
+    monkeypatch.setattr(jobs.pool, "notify", woken.set)
+    listener = asyncio.create_task(jobs.pool.listen())
+    try:
+        await asyncio.sleep(0.5)
+        # As sent by enqueue in an API process, which has no pool to wake
+        async with async_session_maker() as session:
+            await session.execute(select(func.pg_notify(jobs.JOB_CHANNEL, "test")))
+            await session.commit()
+        await asyncio.wait_for(woken.wait(), 5)
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
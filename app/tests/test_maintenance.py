@@ -1,8 +1,17 @@
 import pytest
 from httpx import ASGITransport, AsyncClient
+from datetime import datetime, timezone
 
+from app.database import async_session_maker
+from app.models import Maintenance
+from app.auth import check_member
 from app.main import app
 
+def override_check_member():
+    return {"user_id": 1, "role": "member"}  # Mock user data
+
+app.dependency_overrides[check_member] = override_check_member
+
 @pytest.fixture(scope="session")
 def anyio_backend():
     return "asyncio"
@@ -49,3 +58,74 @@ async def test_maintenance_lifecycle():
 
         response = await ac.delete(f"/maintenance/{maintenance_id}")
         assert response.status_code == 204
+
+@pytest.mark.anyio
+async def test_maintenance_overlap(monkeypatch):
+    datasets_id = 0
+    windows = [
+        {"datasets_id": datasets_id, "parameters_id": 1, "datasetparameters_id": 0,
+         "starttime": "2021-01-01T00:00:00Z", "endtime": "2021-01-10T00:00:00Z", "state": "reported"},
+        {"datasets_id": datasets_id, "parameters_id": 2, "datasetparameters_id": 0,
+         "starttime": "2021-02-01T00:00:00Z", "endtime": None, "state": "reported"},
+    ]
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        with monkeypatch.context() as m:
+            m.delitem(app.dependency_overrides, check_member)
+            response = await ac.post("/maintenance/bulk", json=windows)
+            assert response.status_code == 401
+            response = await ac.post("/maintenance/", json=windows[0])
+            assert response.status_code == 401
+            response = await ac.patch("/maintenance/0", json={"state": "confirmed"})
+            assert response.status_code == 401
+            response = await ac.delete("/maintenance/0")
+            assert response.status_code == 401
+        response = await ac.post("/maintenance/bulk", json=windows)
+        assert response.status_code == 201
+        created = [m["id"] for m in response.json()]
+        assert len(created) == 2
+
+        async def overlapping(**params):
+            response = await ac.get("/maintenance/", params={"datasets_id": datasets_id, **params})
+            assert response.status_code == 200
+            return [m["id"] for m in response.json() if m["id"] in created]
+
+        assert await overlapping() == created
+        assert await overlapping(start="2021-01-05T00:00:00Z", end="2021-01-06T00:00:00Z") == created[:1]
+        assert await overlapping(start="2030-01-01T00:00:00Z") == created[1:]
+        assert await overlapping(end="2020-12-31T00:00:00Z") == []
+        assert await overlapping(parameters_id=2) == created[1:]
+
+        inverted = {**windows[0], "starttime": "2021-01-10T00:00:00Z", "endtime": "2021-01-01T00:00:00Z"}
+        response = await ac.post("/maintenance/bulk", json=[inverted])
+        assert response.status_code == 422
+        response = await ac.patch(f"/maintenance/{created[0]}", json={"endtime": "2020-01-01T00:00:00Z"})
+        assert response.status_code == 422
+        response = await ac.patch(f"/maintenance/{created[0]}", json={
+            "starttime": "2021-01-10T00:00:00Z", "endtime": "2021-01-01T00:00:00Z"})
+        assert response.status_code == 422
+        response = await ac.get("/maintenance/", params={"start": "2021-01-06T00:00:00Z", "end": "2021-01-05T00:00:00Z"})
+        assert response.status_code == 400
+
+        # Rows written outside the API with inverted times are searched as if swapped
+        async with async_session_maker() as session:
+            legacy = Maintenance(datasets_id=datasets_id, parameters_id=3, datasetparameters_id=0,
+                                 starttime=datetime(2019, 1, 10, tzinfo=timezone.utc),
+                                 endtime=datetime(2019, 1, 1, tzinfo=timezone.utc))
+            session.add(legacy)
+            await session.commit()
+            created.append(legacy.id)
+        assert await overlapping(start="2019-01-05T00:00:00Z", end="2019-01-06T00:00:00Z") == created[2:]
+
+        response = await ac.get("/maintenance/", params={"datasets_id": datasets_id})
+        etag = response.headers["etag"]
+        response = await ac.delete(f"/maintenance/{created[0]}")
+        assert response.status_code == 204
+        response = await ac.get("/maintenance/", params={"datasets_id": datasets_id}, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [m["id"] for m in response.json() if m["id"] in created] == created[1:]
+
+        for maintenance_id in created[1:]:
+            response = await ac.delete(f"/maintenance/{maintenance_id}")
+            assert response.status_code == 204
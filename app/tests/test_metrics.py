@@ -0,0 +1,44 @@
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import create_async_engine
+import pytest
+
+from app.database import DATABASE_URL, pool_status
+from app.main import app
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_pool_status():
+    engine = create_async_engine(DATABASE_URL, pool_size=2, max_overflow=1)
+    async with engine.connect():
+        async with engine.connect():
+            async with engine.connect():
+                status = pool_status(engine)
+                assert status["checked_out"] == 3
+                assert status["overflow"] == 1
+    status = pool_status(engine)
+    assert status["checked_out"] == 0
+    assert status["checked_in"] == 2
+    await engine.dispose()
+
+@pytest.mark.anyio
+async def test_metrics():
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        response = await ac.get("/datasets/")
+        assert response.status_code == 200
+        response = await ac.get("/datasets/")
+        assert response.status_code == 200
+        response = await ac.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    metrics = response.text
+    assert "datalakes_db_pool_checked_out" in metrics
+    assert 'datalakes_http_requests_total{method="GET",route="/datasets/",status="200"}' in metrics
+    assert 'datalakes_http_request_duration_seconds_bucket{le="0.005",method="GET",route="/datasets/"}' in metrics
+    assert 'datalakes_db_query_duration_seconds_count{route="/datasets/"}' in metrics
+    assert 'datalakes_cache_requests_total{result="hit",route="/datasets/"}' in metrics
+    assert "/metrics" not in metrics
@@ -0,0 +1,49 @@
+from alembic.config import Config
+from alembic import command
+from sqlalchemy import text
+from pathlib import Path
+import asyncio
+import pytest
+import json
+
+from app.database import async_session_maker
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+QUERIES = [
+    ("ix_datasetparameters_datasets_id", "SELECT * FROM datasetparameters WHERE datasets_id = 1"),
+    ("ix_maintenance_datasets_id", "SELECT * FROM maintenance WHERE datasets_id = 1"),
+    ("ix_maintenance_starttime_endtime", "SELECT * FROM maintenance WHERE starttime < now() AND endtime > now()"),
+    ("ix_files_datasets_id", "SELECT * FROM files WHERE datasets_id = 1"),
+    ("ix_files_mindatetime_maxdatetime", "SELECT * FROM files WHERE mindatetime < now() AND maxdatetime > now()"),
+    ("ix_repositories_ssh", "SELECT * FROM repositories WHERE ssh = 'git@github.com:eawag/test.git'"),
+    ("ix_datasets_location", "SELECT * FROM datasets WHERE point(longitude, latitude) <@ box(point(6, 46), point(7, 47))"),
+    ("ix_datasets_time_range", "SELECT * FROM datasets WHERE tstzrange("
+     "CASE WHEN mindatetime > maxdatetime THEN maxdatetime ELSE mindatetime END, "
+     "CASE WHEN mindatetime > maxdatetime THEN mindatetime ELSE maxdatetime END, '[]') && tstzrange(now(), NULL, '[]')"),
+    ("ix_datasets_depth_range", "SELECT * FROM datasets WHERE numrange("
+     "CASE WHEN mindepth > maxdepth THEN maxdepth ELSE mindepth END, "
+     "CASE WHEN mindepth > maxdepth THEN mindepth ELSE maxdepth END, '[]') && numrange(0, 10, '[]')"),
+    ("ix_maintenance_time_range", "SELECT * FROM maintenance WHERE tstzrange("
+     "CASE WHEN starttime > endtime THEN endtime ELSE starttime END, "
+     "CASE WHEN starttime > endtime THEN starttime ELSE endtime END, '[]') && tstzrange(now(), NULL, '[]')"),
+    ("ix_datasetparameters_parameters_id", "SELECT * FROM datasetparameters WHERE parameters_id = 5"),
+]
+
+@pytest.fixture(scope="session")
+def anyio_backend():
+    return "asyncio"
+
+@pytest.mark.anyio
+async def test_migrations_indexes():
+    config = Config(str(ALEMBIC_INI))
+    config.attributes["configure_logger"] = False
+    await asyncio.to_thread(command.upgrade, config, "head")
+
+    async with async_session_maker() as session:
+        # Tables in the test database are tiny, force the planner to use an index when one exists
+        await session.execute(text("SET enable_seqscan = off"))
+        for index, query in QUERIES:
+            result = await session.execute(text(f"EXPLAIN (FORMAT JSON) {query}"))
+            plan = json.dumps(result.scalar())
+            assert index in plan, f"{query} does not use {index}: {plan}"
@@ -1,13 +1,28 @@
 from httpx import ASGITransport, AsyncClient
 from dotenv import load_dotenv
 from pathlib import Path
+from sqlmodel import delete
+import asyncio
+import hashlib
 import pytest
-import time
+import hmac
+import json
 import os
 
+import app.auth as auth
 from app.main import app
+from app.database import async_session_maker
+from app.models import Repositories, Jobs
+from app.git import Changes
+import app.routes.repositories as repositories
+import app.jobs as jobs
 from app.functions import extract_ssh_parts
 from app.auth import check_member, check_maintainer
+from app.staging import (
+    staging_path, live_path, releases_path, create_release, promote_release, remove_repository, carry_over
+)
+from app.virtualzarr import index_path
+from app.pyramids import pyramid_path
 
 load_dotenv()
 
@@ -24,6 +39,13 @@ app.dependency_overrides[check_maintainer] = override_check
 def anyio_backend():
     return "asyncio"
 
+@pytest.fixture
+async def worker():
+    # Jobs run in the worker process, not in the API
+    jobs.pool.start()
+    yield
+    await jobs.pool.stop()
+
 
 @pytest.mark.anyio
 async def test_repositories():
@@ -37,7 +59,7 @@ async def test_repositories():
 
 
 @pytest.mark.anyio
-async def test_add_repositories():
+async def test_add_repositories(worker):
     repo_ssh = "git@github.com:LeXPLORE-Platform/Meteostation.git"
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
@@ -61,7 +83,7 @@ async def test_add_repositories():
                 raise ValueError("Something failed cloning the repository")
             elif status != "updating":
                 raise ValueError("Incorrect values in the database")
-            time.sleep(0.5)
+            await asyncio.sleep(0.5)
 
         ssh = extract_ssh_parts(repo_ssh)
         repo_path = Path(f'{FILESYSTEM}/git/{repo_id}/{ssh["name"]}')
@@ -70,5 +92,193 @@ async def test_add_repositories():
         assert response.status_code == 204
 
 
+def test_publish_release():
+    repo_id = 0
+    staging = staging_path(repo_id) / "datalakes-test"
+    (staging / "data").mkdir(parents=True, exist_ok=True)
+    (staging / ".git").mkdir(exist_ok=True)
+    (staging / "data" / "file.txt").write_text("v1")
+
+    first = create_release(repo_id)
+    promote_release(repo_id, first)
+    live = live_path(repo_id)
+    assert live.is_symlink()
+    assert not (live / "datalakes-test" / ".git").exists()
+
+    with open(live / "datalakes-test" / "data" / "file.txt") as reader:
+        (staging / "data" / "file.txt").unlink()
+        (staging / "data" / "file.txt").write_text("v2")
+        second = create_release(repo_id)
+        promote_release(repo_id, second)
+        assert reader.read() == "v1"
+    assert (live / "datalakes-test" / "data" / "file.txt").read_text() == "v2"
+    assert first.exists()
+
+    remove_repository(repo_id)
+    assert not live.exists() and not live.is_symlink()
+    assert not staging.exists()
+    assert not releases_path(repo_id).exists()
+
+
+def test_carry_over():
+    repo_id = 0
+    staging = staging_path(repo_id) / "datalakes-test"
+    (staging / "data").mkdir(parents=True, exist_ok=True)
+    (staging / "data" / "file.nc").write_text("data")
+    first = create_release(repo_id)
+    for datasets_id in [1, 2]:
+        index_path(repo_id, datasets_id, root=first).mkdir(parents=True)
+        (index_path(repo_id, datasets_id, root=first) / "0.json").write_text(
+            f'{{"refs": {{"temp/0": ["{first.resolve()}/datalakes-test/data/file.nc", 0, 10]}}}}')
+        pyramid_path(repo_id, datasets_id, root=first).mkdir(parents=True)
+        (pyramid_path(repo_id, datasets_id, root=first) / "86400.nc").write_text("pyramid")
+    promote_release(repo_id, first)
+
+    second = create_release(repo_id)
+    carry_over(repo_id, live_path(repo_id).resolve(), second, [1])
+    index = (index_path(repo_id, 1, root=second) / "0.json").read_text()
+    assert f"{second.resolve()}/datalakes-test/data/file.nc" in index and str(first.resolve()) not in index
+    pyramid = pyramid_path(repo_id, 1, root=second) / "86400.nc"
+    assert pyramid.read_text() == "pyramid"
+    assert pyramid.stat().st_ino == (pyramid_path(repo_id, 1, root=first) / "86400.nc").stat().st_ino
+    assert not index_path(repo_id, 2, root=second).exists() and not pyramid_path(repo_id, 2, root=second).exists()
+
+    remove_repository(repo_id)
+
+
+@pytest.mark.anyio
+async def test_repository_webhook(monkeypatch):
+    monkeypatch.setattr(auth, "WEBHOOK_SECRET", "secret")
+    ssh = "git@github.com:eawag-surface-waters-research/webhook-test.git"
+    async with async_session_maker() as session:
+        repository = Repositories(ssh=ssh, status="success")
+        session.add(repository)
+        await session.commit()
+        await session.refresh(repository)
+
+    def github(payload, event="push", secret="secret"):
+        body = json.dumps(payload).encode()
+        signature = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return {"content": body, "headers": {"X-GitHub-Event": event, "X-Hub-Signature-256": signature,
+                                             "Content-Type": "application/json"}}
+
+    push = {"ref": "refs/heads/main", "repository": {"ssh_url": ssh, "default_branch": "main"}}
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        try:
+            response = await ac.post("/repositories/webhook", **github(push))
+            assert response.status_code == 202
+            jobs = response.json()["jobs"]
+            assert len(jobs) == 1
+            response = await ac.post("/repositories/webhook", **github(push))
+            assert response.json()["jobs"] == jobs
+            job = (await ac.get(f"/jobs/{jobs[0]}")).json()
+            assert job["status"] == "queued" and job["run_at"] > job["created"]
+            assert (await ac.get(f"/repositories/{repository.id}")).json()["status"] == "updating"
+
+            response = await ac.post("/repositories/webhook", content=json.dumps(
+                {"ref": "refs/heads/main", "project": {"git_ssh_url": ssh, "default_branch": "main"}}),
+                headers={"X-Gitlab-Event": "Push Hook", "X-Gitlab-Token": "secret"})
+            assert response.status_code == 202 and response.json()["jobs"] == jobs
+
+            response = await ac.post("/repositories/webhook", **github({**push, "ref": "refs/heads/dev"}))
+            assert response.json() == {"status": "ignored", "jobs": []}
+            response = await ac.post("/repositories/webhook", **github(push, event="ping"))
+            assert response.json() == {"status": "ignored", "jobs": []}
+            response = await ac.post("/repositories/webhook", **github(push, secret="wrong"))
+            assert response.status_code == 401
+            response = await ac.post("/repositories/webhook", **github(
+                {**push, "repository": {"ssh_url": "git@github.com:eawag/unknown.git"}}))
+            assert response.status_code == 404
+        finally:
+            response = await ac.delete(f"/repositories/{repository.id}")
+            assert response.status_code == 204
 
 
+@pytest.mark.anyio
+async def test_repository_status():
+    async with async_session_maker() as session:
+        repository = Repositories(ssh="git@github.com:eawag-surface-waters-research/status-test.git", status="success")
+        session.add(repository)
+        await session.commit()
+        await session.refresh(repository)
+
+    async def add_job(status):
+        async with async_session_maker() as session:
+            session.add(Jobs(kind="sync", repositories_id=repository.id, status=status))
+            await session.commit()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as ac:
+        try:
+            # Without jobs the stored status is kept
+            assert (await ac.get(f"/repositories/{repository.id}")).json()["status"] == "success"
+            await add_job("failed")
+            assert (await ac.get(f"/repositories/{repository.id}")).json()["status"] == "failed"
+            rows = (await ac.get("/repositories/", params={"status": "failed", "fields": "status"})).json()
+            assert {"id": repository.id, "status": "failed"} in rows
+            await add_job("running")
+            assert (await ac.get(f"/repositories/{repository.id}")).json()["status"] == "updating"
+            rows = (await ac.get("/repositories/", params={"status": "failed"})).json()
+            assert repository.id not in [row["id"] for row in rows]
+        finally:
+            async with async_session_maker() as session:
+                await session.execute(delete(Jobs).where(Jobs.repositories_id == repository.id))
+                await session.commit()
+            response = await ac.delete(f"/repositories/{repository.id}")
+            assert response.status_code == 204
+
+
+@pytest.mark.anyio
+async def test_sync_deleted_repository(monkeypatch):
+    async with async_session_maker() as session:
+        repository = Repositories(ssh="git@github.com:eawag-surface-waters-research/deleted-test.git", status="updating")
+        session.add(repository)
+        await session.commit()
+        await session.refresh(repository)
+
+    async def clone(ssh, repo_path, branch=None, paths=None):
+        Path(repo_path).mkdir(parents=True)
+        (Path(repo_path) / "data.nc").write_bytes(b"")
+        # The repository is deleted while the clone runs
+        async with async_session_maker() as session:
+            await session.delete(await session.get(Repositories, repository.id))
+            await session.commit()
+        return Changes(None, "head", None)
+
+    monkeypatch.setattr(repositories, "clone_repository", clone)
+    await repositories.sync_repository(Jobs(kind="sync", repositories_id=repository.id, attempts=1, max_attempts=1))
+    assert not staging_path(repository.id).exists()
+    assert not releases_path(repository.id).exists()
+    assert not live_path(repository.id).exists()
+
+@pytest.mark.anyio
+async def test_delete_repository_while_publishing(monkeypatch):
+    async with async_session_maker() as session:
+        repository = Repositories(ssh="git@github.com:eawag-surface-waters-research/publishing-test.git", status="updating")
+        session.add(repository)
+        await session.commit()
+        await session.refresh(repository)
+
+    async def clone(ssh, repo_path, branch=None, paths=None):
+        Path(repo_path).mkdir(parents=True)
+        (Path(repo_path) / "data.nc").write_bytes(b"")
+        return Changes(None, "head", None)
+
+    publish = repositories.publish_repository
+
+    async def publish_deleted(session, repositories_id, **kwargs):
+        # The delete request does not wait for the publish to finish
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as ac:
+            response = await asyncio.wait_for(ac.delete(f"/repositories/{repositories_id}"), 5)
+        assert response.status_code == 204
+        await publish(session, repositories_id, **kwargs)
+
+    monkeypatch.setattr(repositories, "clone_repository", clone)
+    monkeypatch.setattr(repositories, "publish_repository", publish_deleted)
+    await repositories.sync_repository(Jobs(kind="sync", repositories_id=repository.id, attempts=1, max_attempts=1))
+    assert not staging_path(repository.id).exists()
+    assert not releases_path(repository.id).exists()
+    assert not live_path(repository.id).exists()
@@ -21,9 +21,13 @@ async def test_selectiontables():
         transport=ASGITransport(app=app), base_url="http://test"
     ) as ac:
         response = await ac.get("/selectiontables/")
-    assert response.status_code == 200
-    for key in TABLE_MODELS:
-        assert key in response.json(), f"Expected key '{key}' not found in response"
+        assert response.status_code == 200
+        for key in TABLE_MODELS:
+            assert key in response.json(), f"Expected key '{key}' not found in response"
+        assert response.json()["axis"] == [{"name": "M"}, {"name": "x"}, {"name": "y"}, {"name": "z"}]
+
+        lakes = await ac.get("/selectiontables/lakes")
+        assert sorted(lakes.json(), key=lambda row: row["id"]) == response.json()["lakes"]
 
 
 @pytest.mark.anyio
@@ -37,15 +41,20 @@ async def test_create_table_row():
     async with AsyncClient(
             transport=ASGITransport(app=app), base_url="http://test"
     ) as ac:
+        response = await ac.get("/selectiontables/")
+        assert response.status_code == 200
         response = await ac.post(
             f"/selectiontables/{table_name}",
             json=test_data
         )
-    print(response)
-    assert response.status_code == 201
-    data = response.json()
-    for key, value in test_data.items():
-        assert data[key] == value
+        print(response)
+        assert response.status_code == 201
+        data = response.json()
+        for key, value in test_data.items():
+            assert data[key] == value
+
+        response = await ac.get("/selectiontables/")
+        assert data["id"] in [row["id"] for row in response.json()[table_name]]
 
 
 @pytest.mark.anyio
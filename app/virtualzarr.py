@@ -0,0 +1,172 @@
+from typing import Collection, Dict, List, Optional
+from pathlib import Path
+from kerchunk.hdf import SingleHdf5ToZarr
+from kerchunk.combine import MultiZarrToZarr
+import numpy as np
+import xarray as xr
+import asyncio
+import logging
+import shutil
+import json
+import os
+
+from app.netcdf import Source, dataset_files, repository_datasets, to_epoch, DEFAULT_WINDOW_DAYS
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FILESYSTEM = os.getenv("FILESYSTEM")
+INDEX_FOLDER = ".virtualzarr"
+MANIFEST = "index.json"
+
+
+def index_path(repositories_id: int, datasets_id: int, root: Optional[Path] = None) -> Path:
+    """Folder holding the VirtualZarr reference stores of a dataset"""
+    return Path(root or f"{FILESYSTEM}/git/{repositories_id}") / INDEX_FOLDER / str(datasets_id)
+
+
+def index_variables(folder: Path) -> Optional[List[str]]:
+    """Variables of the index in folder, None when there is none"""
+    try:
+        with open(folder / MANIFEST) as f:
+            return json.load(f)["variables"]
+    except FileNotFoundError:
+        return None
+
+
+def relocate_index(folder: Path, target: Path, old_root: Path, new_root: Path):
+    """Copy an index to another release, pointing its references at the files of that release"""
+    tmp = target.with_name(f"{target.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    for file in folder.iterdir():
+        (tmp / file.name).write_text(file.read_text().replace(f"{old_root.resolve()}/", f"{new_root.resolve()}/"))
+    tmp.rename(target)
+
+
+def file_references(file: Path, keep: List[str]) -> Dict:
+    """Kerchunk references of a single NetCDF file, limited to the variables in keep"""
+    with open(file, "rb") as f:
+        refs = SingleHdf5ToZarr(f, str(file), inline_threshold=0).translate()
+    refs["refs"] = {
+        key: value for key, value in refs["refs"].items()
+        if "/" not in key or key.split("/")[0] in keep
+    }
+    return refs
+
+
+def build_dataset_index(files: List[Path], variables: List[str], time: str, depth: Optional[str], folder: Path) -> Dict:
+    """
+    Write the VirtualZarr reference stores for a dataset.
+
+    Consecutive files that share the same depth axis are combined into a single store
+    concatenated along time. Profile datasets (one timestep per file) are written to one
+    store with a group per profile. A manifest with the time range of each store is written
+    alongside the stores so readers can open only the stores that overlap their window.
+    """
+    keep = list(dict.fromkeys([time] + ([depth] if depth else []) + variables))
+    periods = []
+    for file in files:
+        with xr.open_dataset(file) as ds:
+            missing = [v for v in keep if v not in ds.variables]
+            if missing:
+                logging.warning(f"Skipping {file.name} in index, missing variables {', '.join(missing)}")
+                continue
+            times = to_epoch(ds[time].values)
+            axis = tuple(np.round(ds[depth].values.astype("float64"), 6).tolist()) if depth else None
+            time_dim = ds[time].dims[0]
+            depth_dim = ds[depth].dims[0] if depth else None
+        entry = {"file": file, "refs": file_references(file, keep), "start": float(np.nanmin(times)),
+                 "end": float(np.nanmax(times)), "steps": len(times)}
+        if periods and periods[-1]["axis"] == axis:
+            periods[-1]["files"].append(entry)
+        else:
+            periods.append({"axis": axis, "files": [entry]})
+
+    tmp = folder.with_name(f"{folder.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    stores = []
+    entries = [e for p in periods for e in p["files"]]
+    if depth and len(entries) > 1 and all(e["steps"] == 1 for e in entries):
+        refs = {".zgroup": json.dumps({"zarr_format": 2})}
+        for i, e in enumerate(entries):
+            refs.update({f"{i}/{k}": v for k, v in e["refs"]["refs"].items()})
+            stores.append({"path": "profiles.json", "group": str(i), "start": e["start"], "end": e["end"]})
+        with open(tmp / "profiles.json", "w") as f:
+            json.dump({"version": 1, "refs": refs}, f)
+    else:
+        for i, period in enumerate(periods):
+            refs = MultiZarrToZarr(
+                [e["refs"] for e in period["files"]],
+                concat_dims=[time_dim],
+                identical_dims=[depth_dim] if depth else None,
+                coo_map={time_dim: f"cf:{time}"}
+            ).translate()
+            with open(tmp / f"{i}.json", "w") as f:
+                json.dump(refs, f)
+            stores.append({"path": f"{i}.json", "group": None,
+                           "start": min(e["start"] for e in period["files"]),
+                           "end": max(e["end"] for e in period["files"])})
+
+    manifest = {"variables": keep, "time": time, "depth": depth, "files": len(entries), "stores": stores}
+    with open(tmp / MANIFEST, "w") as f:
+        json.dump(manifest, f)
+
+    old = folder.with_name(f"{folder.name}.old")
+    if folder.exists():
+        folder.rename(old)
+    tmp.rename(folder)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def index_sources(repositories_id: int, datasets_id: int, keep: List[str], start: Optional[float] = None,
+                  end: Optional[float] = None, root: Optional[Path] = None) -> Optional[List[Source]]:
+    """
+    Return the reference stores of a dataset that overlap [start, end].
+
+    Returns None when the dataset has no index or the index does not contain all variables.
+    """
+    folder = index_path(repositories_id, datasets_id, root=root)
+    try:
+        with open(folder / MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if not set(keep).issubset(manifest["variables"]) or len(manifest["stores"]) == 0:
+        return None
+    stores = manifest["stores"]
+    if end is None:
+        end = max(s["end"] for s in stores)
+    if start is None:
+        start = end - DEFAULT_WINDOW_DAYS * 86400
+    selected = [s for s in stores if s["end"] >= start and s["start"] <= end]
+    return [Source(folder / s["path"], s["group"]) for s in (selected or stores[-1:])]
+
+
+async def build_repository_index(session, repositories_id: int, root: Optional[Path] = None, reuse: Collection[int] = ()):
+    """
+    Build the VirtualZarr index of every dataset in a repository, or of a release at root.
+
+    Datasets in reuse keep the index already in place when it has the current variables.
+    """
+    datasets = await repository_datasets(session, repositories_id)
+    # Release the connection, none is held while building
+    await session.commit()
+    for dataset, time, depth, variables in datasets:
+        try:
+            keep = list(dict.fromkeys([time] + ([depth] if depth else []) + variables))
+            if dataset.id in reuse and index_variables(index_path(repositories_id, dataset.id, root=root)) == keep:
+                logging.info(f"Reused VirtualZarr index for dataset {dataset.id}")
+                continue
+            files = dataset_files(repositories_id, dataset.datasourcelink, dataset.fileconnect, root=root)
+            if len(files) == 0:
+                continue
+            await asyncio.to_thread(
+                build_dataset_index, files, variables, time, depth, index_path(repositories_id, dataset.id, root=root)
+            )
+            logging.info(f"Built VirtualZarr index for dataset {dataset.id}")
+        except Exception as e:
+            logging.error(f"Error building VirtualZarr index for dataset {dataset.id}: {e}")
@@ -0,0 +1,48 @@
+"""Background job worker, runs the job pool apart from the API processes: python -m app.worker"""
+import asyncio
+import logging
+import signal
+import sys
+
+from dotenv import load_dotenv
+
+import app.routes.repositories  # noqa: F401, registers the sync handler
+from app.cache import cache
+from app.database import check_db_connection, engine, DATABASE_URL, get_safe_db_url
+from app.jobs import pool
+
+load_dotenv()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(levelname)s:     %(message)s'
+)
+
+
+async def main():
+    logging.info(f"Database: {get_safe_db_url(DATABASE_URL)}")
+    if not await check_db_connection(max_retries=3, retry_delay=2):
+        logging.warning("FATAL ERROR: Cannot connect to database!")
+        await engine.dispose()
+        sys.exit(1)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    pool.start()
+    listener = asyncio.create_task(pool.listen())
+    logging.info(f"Job worker ready with {pool.size} workers.")
+
+    await stop.wait()
+
+    logging.info("Shutting down job worker...")
+    listener.cancel()
+    await asyncio.gather(listener, return_exceptions=True)
+    await pool.stop()
+    await engine.dispose()
+    await cache.close()
+    logging.info("Shutdown complete.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
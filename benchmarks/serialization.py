@@ -0,0 +1,84 @@
+"""
+Compare the old and new serialization paths of GET /datasets/ and GET /datasetparameters/.
+
+old: load ORM rows, run them through jsonable_encoder and json.dumps (FastAPI's default)
+new: let Postgres build the JSON array with json_agg and send the bytes as they are
+
+Synthetic rows are inserted inside a transaction that is rolled back, the database is left
+unchanged. Run from the repository root with the database environment variables set:
+
+    python -m benchmarks.serialization --rows 2000 --repeat 20
+"""
+from fastapi.encoders import jsonable_encoder
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel import select
+import argparse
+import asyncio
+import json
+import time
+
+from app.database import engine
+from app.models import Datasets, Datasetparameters
+from app.routes.datasets import datasets_query
+from app.routes.datasetparameters import datasetparameters_query
+
+PLOTPROPERTIES = {"colors": "Rainbow", "markerLabel": True, "markerSymbol": "circle", "markerFixedSize": True,
+                  "markerSize": 20, "vectorMagnitude": False, "vectorArrows": False, "vectorFlow": False,
+                  "vectorArrowColor": False, "vectorFlowColor": False, "legend": False}
+
+
+async def timed(session: AsyncSession, run, repeat: int) -> float:
+    """Median seconds of run over repeat calls, with the identity map cleared like a new request"""
+    times = []
+    for _ in range(repeat):
+        session.expunge_all()
+        start = time.perf_counter()
+        await run()
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+async def main(rows: int, repeat: int):
+    async with AsyncSession(engine) as session:
+        datasets = [Datasets(title=f"Benchmark {i}", description="Benchmark dataset " * 10, dataportal="benchmark",
+                             plotproperties=PLOTPROPERTIES, latitude=46.5, longitude=6.6, datasourcelink="x.nc")
+                    for i in range(rows)]
+        session.add_all(datasets)
+        await session.flush()
+        session.add_all([Datasetparameters(datasets_id=d.id, parameters_id=p, axis="y", parseparameter=f"p{p}",
+                                           unit="m") for d in datasets for p in range(5)])
+        await session.flush()
+
+        async def datasets_old():
+            result = await session.exec(select(Datasets).where(
+                Datasets.title.is_not(None), Datasets.dataportal.is_not(None)))
+            return json.dumps(jsonable_encoder(result.all())).encode()
+
+        async def datasets_new():
+            return (await session.exec(datasets_query())).one().encode()
+
+        async def datasetparameters_old():
+            result = await session.exec(select(Datasetparameters))
+            return json.dumps(jsonable_encoder(result.all())).encode()
+
+        async def datasetparameters_new():
+            return (await session.exec(datasetparameters_query())).one().encode()
+
+        print(f"{'endpoint':<22}{'old (ms)':>10}{'new (ms)':>10}{'speedup':>9}{'size (kB)':>11}")
+        for name, old, new in [("/datasets/", datasets_old, datasets_new),
+                               ("/datasetparameters/", datasetparameters_old, datasetparameters_new)]:
+            assert len(json.loads(await old())) == len(json.loads(await new()))
+            t_old = await timed(session, old, repeat)
+            t_new = await timed(session, new, repeat)
+            size = len(await new()) / 1000
+            print(f"{name:<22}{t_old * 1000:>10.1f}{t_new * 1000:>10.1f}{t_old / t_new:>8.1f}x{size:>11.0f}")
+        await session.rollback()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000, help="Synthetic datasets to add, each with 5 parameters")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed calls per path")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,33 @@
+"""Index foreign key lookups, time ranges and repository urls
+
+The base schema is created by db/datalakes_schema.sql, which only defines primary keys.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_datasetparameters_datasets_id", "datasetparameters", ["datasets_id"]),
+    ("ix_maintenance_datasets_id", "maintenance", ["datasets_id"]),
+    ("ix_maintenance_starttime_endtime", "maintenance", ["starttime", "endtime"]),
+    ("ix_files_datasets_id", "files", ["datasets_id"]),
+    ("ix_files_mindatetime_maxdatetime", "files", ["mindatetime", "maxdatetime"]),
+    ("ix_repositories_ssh", "repositories", ["ssh"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
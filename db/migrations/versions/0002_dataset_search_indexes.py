@@ -0,0 +1,39 @@
+"""GiST indexes for dataset search by location, time range and depth range
+
+Expression indexes on core Postgres types (point, tstzrange, numrange), PostGIS is not needed.
+Range bounds stored the wrong way round are swapped so such rows can still be written.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+
+def ordered_range(function: str, lower: str, upper: str) -> str:
+    """Same expression as app.database.ordered_range"""
+    return (f"{function}(CASE WHEN {lower} > {upper} THEN {upper} ELSE {lower} END, "
+            f"CASE WHEN {lower} > {upper} THEN {lower} ELSE {upper} END, '[]')")
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS ix_datasets_location ON datasets USING gist (point(longitude, latitude))")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_datasets_time_range ON datasets "
+               f"USING gist ({ordered_range('tstzrange', 'mindatetime', 'maxdatetime')})")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_datasets_depth_range ON datasets "
+               f"USING gist ({ordered_range('numrange', 'mindepth', 'maxdepth')})")
+    op.create_index("ix_datasetparameters_parameters_id", "datasetparameters", ["parameters_id"],
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index("ix_datasetparameters_parameters_id", table_name="datasetparameters", if_exists=True)
+    op.execute("DROP INDEX IF EXISTS ix_datasets_depth_range")
+    op.execute("DROP INDEX IF EXISTS ix_datasets_time_range")
+    op.execute("DROP INDEX IF EXISTS ix_datasets_location")
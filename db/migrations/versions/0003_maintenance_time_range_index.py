@@ -0,0 +1,24 @@
+"""GiST index for maintenance windows overlapping a time range
+
+Windows stored with the end before the start are swapped so such rows can still be written.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE INDEX IF NOT EXISTS ix_maintenance_time_range ON maintenance USING gist (tstzrange("
+               "CASE WHEN starttime > endtime THEN endtime ELSE starttime END, "
+               "CASE WHEN starttime > endtime THEN starttime ELSE endtime END, '[]'))")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_maintenance_time_range")
@@ -0,0 +1,40 @@
+"""Jobs table of the background job queue
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "jobs",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("kind", sa.String, nullable=False),
+        sa.Column("repositories_id", sa.Integer, nullable=False),
+        sa.Column("payload", sa.JSON),
+        sa.Column("status", sa.String, nullable=False, server_default="queued"),
+        sa.Column("attempts", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("max_attempts", sa.Integer, nullable=False, server_default="1"),
+        sa.Column("error", sa.String),
+        sa.Column("run_at", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        sa.Column("locked_until", sa.TIMESTAMP(timezone=True)),
+        sa.Column("created", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated", sa.TIMESTAMP(timezone=True), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+    op.create_index("ix_jobs_repositories_id", "jobs", ["repositories_id"], if_not_exists=True)
+    op.create_index("ix_jobs_status_run_at", "jobs", ["status", "run_at"], if_not_exists=True)
+    op.create_index("ix_jobs_queued", "jobs", ["kind", "repositories_id"], unique=True,
+                    postgresql_where=sa.text("status = 'queued'"), if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table("jobs", if_exists=True)
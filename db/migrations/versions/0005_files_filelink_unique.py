@@ -0,0 +1,25 @@
+"""Unique file per dataset so the file indexer can upsert
+
+Duplicate rows left by earlier writers are removed first, keeping the newest.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("DELETE FROM files a USING files b "
+               "WHERE a.datasets_id = b.datasets_id AND a.filelink = b.filelink AND a.id < b.id")
+    op.create_index("ix_files_datasets_id_filelink", "files", ["datasets_id", "filelink"], unique=True,
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index("ix_files_datasets_id_filelink", table_name="files", if_exists=True)